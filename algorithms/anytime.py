@@ -0,0 +1,69 @@
+"""Anytime optimization: a valid plan right away, improved until the time budget runs out."""
+import copy
+import time
+from typing import Callable, Optional
+
+from algorithms.local_search import rebalance_plan
+from algorithms.sweep import SweepPlan, plan_sweep, start_angles
+
+
+class Budget:
+    """Wall-clock budget (None = unlimited) plus the improvement trajectory."""
+
+    def __init__(self, time_budget_ms: Optional[int] = None):
+        self.started = time.monotonic()
+        self.deadline = None if time_budget_ms is None else self.started + time_budget_ms / 1000
+        self.trajectory: list[dict] = []
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def elapsed_ms(self) -> int:
+        return int((time.monotonic() - self.started) * 1000)
+
+    def record(self, step: str, **metrics):
+        self.trajectory.append({"step": step, "elapsed_ms": self.elapsed_ms(), **metrics})
+
+
+def plan_metrics(plan: SweepPlan) -> dict:
+    return {
+        "total_cluster": len(plan.clusters),
+        "total_jarak_km": round(plan.total_distance, 2),
+        "total_waktu_jam": round(plan.total_time, 2),
+        "sisa_kg": round(plan.unserved_kg, 2),
+    }
+
+
+def anytime_plan(stops, vehicles, legs, planner: Callable, budget: Budget, rebalance: bool = True,
+                 restarts: bool = True, **kwargs) -> SweepPlan:
+    """Construct with planner, then rebalance and try rotated sweep restarts until the budget expires.
+
+    A restart only replaces the current plan when its score (sisa kg, km, jam) is
+    better; every accepted plan is appended to budget.trajectory. Restarts are
+    sweeps, so pass restarts=False for any other planner (e.g. savings) to keep
+    its plan; it then returns as soon as rebalance converges.
+    """
+    pristine = copy.deepcopy(stops)
+    best = planner(stops, vehicles, legs, **kwargs)
+    budget.record("construction", **plan_metrics(best))
+
+    if rebalance and not budget.expired():
+        if rebalance_plan(best, legs, budget=budget):
+            budget.record("rebalance", **plan_metrics(best))
+
+    if not restarts or budget.deadline is None:
+        return best
+
+    for angle in start_angles(pristine, len(pristine)):
+        for descending in (True, False):
+            if budget.expired():
+                return best
+            candidate = plan_sweep(copy.deepcopy(pristine), vehicles, legs,
+                                   start_angle=angle, descending=descending, **kwargs)
+            if rebalance:
+                rebalance_plan(candidate, legs, budget=budget)
+            if candidate.score() < best.score():
+                best = candidate
+                arah = "menurun" if descending else "naik"
+                budget.record(f"restart {angle:.1f}° {arah}", **plan_metrics(best))
+    return best
@@ -1,4 +1,5 @@
-from utils.routing import ors_directions_request
+from utils.providers import get_provider
+from utils.spatial import NN_CANDIDATES, SpatialIndex
 import time
 
 # Constants
@@ -26,8 +27,8 @@ def calculate_travel_time(dist_km: float) -> float:
     return dist_km / SPEED + calculate_red_light_time(dist_km)
 
 def get_duration_distance(origin: tuple, destination: tuple) -> tuple:
-    """Helper buat ambil durasi dan jarak ORS."""
-    return ors_directions_request(origin, destination)
+    """Helper buat ambil durasi dan jarak dari routing provider aktif."""
+    return get_provider().directions(origin, destination)
 
 
 # Main Functions
@@ -115,27 +116,34 @@ def nearest_neighbor_route(locations: list[dict], depot=DEPOT_COORD, cluster_id=
     if vehicle_id is None:
         raise ValueError("vehicle_id harus diisi untuk insert ke ClusterRoute!")
 
-    remaining = locations[:]
+    coords = [(loc["longitude"], loc["latitude"]) for loc in locations]
+    index = SpatialIndex(coords)
     route = []
-    current = {"longitude": depot[0], "latitude": depot[1]}
+    current = depot
     order_no = 1
 
-    while remaining:
-        nearest = None
+    while index.remaining:
+        best = None
         nearest_dist = float('inf')
 
-        for loc in remaining:
-            dur, dist = get_duration_distance(
-                (current["longitude"], current["latitude"]),
-                (loc["longitude"], loc["latitude"])
-            )
-            if dist is not None and dist < nearest_dist:
-                nearest = loc
-                nearest_dist = dist
-
-        if nearest is None:
+        # Cek kandidat terdekat dulu, baru scan sisanya kalau tidak ada yang bisa dirute
+        checked = set()
+        for k in (NN_CANDIDATES, index.remaining):
+            for i in index.nearest(current, k):
+                if i in checked:
+                    continue
+                checked.add(i)
+                dur, dist = get_duration_distance(current, coords[i])
+                if dist is not None and dist < nearest_dist:
+                    best = i
+                    nearest_dist = dist
+            if best is not None or k >= index.remaining:
+                break
+
+        if best is None:
             break
 
+        nearest = locations[best]
         route.append({
             "cluster_id": cluster_id,
             "vehicle_id": vehicle_id,
@@ -147,7 +155,7 @@ def nearest_neighbor_route(locations: list[dict], depot=DEPOT_COORD, cluster_id=
             "jarak_tempuh_km": nearest.get("jarak_tempuh_km") or 0,
         })
         order_no += 1
-        current = {"longitude": nearest["longitude"], "latitude": nearest["latitude"]}
-        remaining.remove(nearest)
+        current = coords[best]
+        index.remove(best)
 
     return route
@@ -0,0 +1,72 @@
+"""Exact route order for small clusters (Held-Karp bitmask dynamic programming).
+
+O(2^n * n^2) time and O(2^n * n) memory, so only used up to HELD_KARP_MAX_STOPS
+stops; larger clusters keep nearest neighbor + 2-opt/Or-opt.
+"""
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from algorithms.local_search import _prepare
+
+HELD_KARP_MAX_STOPS = int(os.getenv("HELD_KARP_MAX_STOPS", "12"))
+
+
+def held_karp(cost: np.ndarray) -> list[int]:
+    """Optimal depot -> ... -> depot order over indices 1..n-1 of cost (index 0 = depot, may be asymmetric)."""
+    cost = _prepare(cost)
+    n = len(cost) - 1
+    if n <= 1:
+        return list(range(1, n + 1))
+    c = cost[1:, 1:]
+    full = 1 << n
+
+    # dp[mask, j]: jarak minimum depot -> semua stop di mask, berakhir di j.
+    # Diisi per ukuran subset; tiap (mask, j) cuma punya satu pendahulu mask ^ bit j,
+    # jadi satu lapis dihitung sekaligus tanpa tabrakan indeks.
+    dp = np.full((full, n), np.inf)
+    parent = np.full((full, n), -1, dtype=np.int64)
+    bits = 1 << np.arange(n)
+    dp[bits, np.arange(n)] = cost[0, 1:]
+
+    masks = np.arange(full)
+    size = np.zeros(full, dtype=np.int64)
+    for bit in bits:
+        size += (masks & bit) > 0
+    for layer in range(2, n + 1):
+        target = masks[size == layer]
+        prev = target[:, None] ^ bits[None, :]               # [mask, j]
+        cand = dp[prev] + c.T[None, :, :]                    # [mask, j, k] = dp[prev, k] + c[k, j]
+        best_k = np.argmin(cand, axis=2)
+        best = np.take_along_axis(cand, best_k[:, :, None], axis=2)[:, :, 0]
+        member = (target[:, None] & bits[None, :]) > 0
+        dp[target] = np.where(member, best, np.inf)
+        parent[target] = np.where(member, best_k, -1)
+
+    last = int(np.argmin(dp[full - 1] + cost[1:, 0]))
+    order, mask = [], full - 1
+    while last >= 0:
+        order.append(last + 1)
+        prev = int(parent[mask, last])
+        mask ^= 1 << last
+        last = prev
+    return order[::-1]
+
+
+@lru_cache(maxsize=1024)
+def _cached_order(ids: tuple, n: int, cost_bytes: bytes) -> tuple:
+    cost = np.frombuffer(cost_bytes, dtype=float).reshape(n, n)
+    return tuple(ids[i - 1] for i in held_karp(cost))
+
+
+def exact_order(ids: list, cost: np.ndarray) -> list:
+    """Optimal visiting order of ids; cost is the depot + ids block (index 0 = depot).
+
+    Memoized on the stop set (and its costs), so regenerating routes for
+    unchanged clusters is a dict lookup.
+    """
+    key = sorted(range(len(ids)), key=lambda i: ids[i])
+    rows = [0] + [i + 1 for i in key]
+    block = np.ascontiguousarray(np.asarray(cost, dtype=float)[np.ix_(rows, rows)])
+    return list(_cached_order(tuple(ids[i] for i in key), len(rows), block.tobytes()))
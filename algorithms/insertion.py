@@ -0,0 +1,125 @@
+"""Cheapest insertion of late stops into an already planned day.
+
+Used when new DailyPengepul rows arrive after clustering: existing clusters keep
+their stops and order, new stops are slotted in where they add the fewest km,
+and a new cluster is opened only when no existing one can take them.
+"""
+from datetime import date
+
+import numpy as np
+
+from algorithms.clustering import MAX_HOURS
+from algorithms.savings import pick_vehicle
+from algorithms.sweep import (
+    MAX_CLUSTER_PER_DAY, MIN_PICKUP_KG, PENDING, SERVED,
+    Fleet, LegTable, PlannedCluster, Stop, Visit, next_workday, travel_time, unload_time,
+)
+
+
+def retotal(cluster: PlannedCluster, legs: LegTable):
+    """Hitung ulang jarak/waktu tiap visit dan total cluster dari urutan visits sekarang."""
+    rows = [0] + [legs.rows[v.stop.id] for v in cluster.visits] + [0]
+    cluster.total_load = cluster.total_time = cluster.total_distance = 0.0
+    for k, visit in enumerate(cluster.visits):
+        dist = float(legs.dist[rows[k], rows[k + 1]])
+        visit.distance = dist
+        visit.travel_time = float(travel_time(dist))
+        cluster.total_load += visit.nilai_diangkut
+        cluster.total_time += visit.travel_time + unload_time(visit.nilai_diangkut)
+        cluster.total_distance += dist
+    if cluster.visits:
+        back = float(legs.dist[rows[-2], 0])
+        cluster.total_time += float(travel_time(back))
+        cluster.total_distance += back
+
+
+def _cheapest_position(cluster: PlannedCluster, row: int, muatan: float, legs: LegTable):
+    """(tambahan km, posisi) termurah yang masih di bawah MAX_HOURS, atau None."""
+    tour = np.array([0] + [legs.rows[v.stop.id] for v in cluster.visits] + [0], dtype=int)
+    a, b = tour[:-1], tour[1:]
+    to_stop, from_stop, direct = legs.dist[a, row], legs.dist[row, b], legs.dist[a, b]
+    with np.errstate(invalid="ignore"):
+        extra_km = to_stop + from_stop - direct
+        extra_time = travel_time(to_stop) + travel_time(from_stop) - travel_time(direct) + unload_time(muatan)
+        feasible = cluster.total_time + extra_time <= MAX_HOURS  # NaN = tidak bisa dirute, gagal di sini
+    if not feasible.any():
+        return None
+    extra_km = np.where(feasible, extra_km, np.inf)
+    pos = int(np.argmin(extra_km))
+    return float(extra_km[pos]), pos
+
+
+def _visit(stop: Stop, remaining: float, muatan: float) -> Visit:
+    nilai_akhir = remaining - muatan
+    stop.nilai_ekspektasi_awal = remaining
+    stop.nilai_ekspektasi_akhir = nilai_akhir
+    stop.status = SERVED if nilai_akhir == 0 else PENDING
+    stop.dirty = True
+    return Visit(stop, remaining, muatan, nilai_akhir, stop.status, 0.0, 0.0)
+
+
+def insert_stops(clusters: list[PlannedCluster], stops: list[Stop], vehicles: list[Fleet], legs: LegTable,
+                 tanggal: date, max_clusters_per_day: int = MAX_CLUSTER_PER_DAY) -> list[PlannedCluster]:
+    """Sisipkan stops ke clusters (hari tanggal) dengan cheapest insertion.
+
+    Per stop (muatan terbesar dulu): cluster yang muat seluruh sisa dan tambahan
+    km-nya paling kecil dipilih; kalau tidak ada, buka cluster baru (kendaraan
+    terkecil yang muat) selama jumlah cluster < max_clusters_per_day; kalau
+    tetap tidak bisa, sisa diisi sebagian ke cluster dengan ruang >= MIN_PICKUP_KG.
+    Sisa yang tidak tertampung tetap PENDING dan digeser ke hari kerja berikutnya
+    (seperti run_horizon). clusters & stops diubah in place; return cluster yang
+    berubah atau baru.
+    """
+    for cluster in clusters:
+        retotal(cluster, legs)
+
+    touched = {}
+    for stop in sorted(stops, key=lambda s: -s.nilai_ekspektasi_akhir):
+        remaining = float(stop.nilai_ekspektasi_akhir)
+        stop.tanggal = tanggal
+        row = legs.rows[stop.id]
+
+        while remaining >= MIN_PICKUP_KG:
+            # Split pickup: satu stop tidak boleh dua kali di cluster yang sama
+            open_clusters = [c for c in clusters if all(v.stop.id != stop.id for v in c.visits)]
+            best = None
+            for cluster in open_clusters:
+                if cluster.vehicle.kapasitas - cluster.total_load < remaining:
+                    continue
+                hit = _cheapest_position(cluster, row, remaining, legs)
+                if hit is not None and (best is None or hit[0] < best[0]):
+                    best = (hit[0], hit[1], cluster, remaining)
+
+            if best is None and len(clusters) < max_clusters_per_day and vehicles:
+                vehicle = pick_vehicle(vehicles, remaining)
+                cluster = PlannedCluster(cluster_id=max((c.cluster_id for c in clusters), default=0) + 1,
+                                         tanggal=tanggal, vehicle=vehicle)
+                muatan = min(remaining, vehicle.kapasitas)
+                hit = _cheapest_position(cluster, row, muatan, legs)
+                if hit is not None:
+                    clusters.append(cluster)
+                    best = (hit[0], hit[1], cluster, muatan)
+
+            if best is None:
+                for cluster in open_clusters:
+                    muatan = min(remaining, cluster.vehicle.kapasitas - cluster.total_load)
+                    if muatan < MIN_PICKUP_KG:
+                        continue
+                    hit = _cheapest_position(cluster, row, muatan, legs)
+                    if hit is not None and (best is None or hit[0] < best[0]):
+                        best = (hit[0], hit[1], cluster, muatan)
+
+            if best is None:
+                break
+
+            _, pos, cluster, muatan = best
+            cluster.visits.insert(pos, _visit(stop, remaining, muatan))
+            retotal(cluster, legs)
+            touched[id(cluster)] = cluster
+            remaining -= muatan
+
+        if stop.is_open:
+            stop.tanggal = next_workday(tanggal)
+            stop.dirty = True
+
+    return list(touched.values())
@@ -0,0 +1,241 @@
+"""Local search against a dense cost matrix: intra-route 2-opt / Or-opt and
+inter-route relocate / swap / cross-exchange between a day's clusters.
+
+Routes are lists of matrix indices with the depot (index 0) implicit at both
+ends. The matrix may be asymmetric: 2-opt deltas use prefix sums of forward and
+backward edge costs, so every move is still evaluated in O(1).
+"""
+from itertools import combinations
+
+import numpy as np
+
+from algorithms.clustering import MAX_HOURS
+from algorithms.sweep import travel_time, unload_time
+
+NEIGHBORS = 8
+UNROUTABLE_COST = 1e6  # leg tanpa rute: boleh dipakai, tapi selalu dihindari
+
+
+def _prepare(cost: np.ndarray) -> np.ndarray:
+    cost = np.array(cost, dtype=float)
+    cost[np.isnan(cost)] = UNROUTABLE_COST
+    return cost
+
+
+def neighbor_lists(cost: np.ndarray, k: int = NEIGHBORS) -> np.ndarray:
+    """For every index, the k cheapest successors (excluding itself and the depot)."""
+    c = cost.copy()
+    np.fill_diagonal(c, np.inf)
+    c[:, 0] = np.inf
+    k = max(1, min(k, len(c) - 2))
+    return np.argsort(c, axis=1, kind="stable")[:, :k]
+
+
+def route_cost(route: list[int], cost: np.ndarray) -> float:
+    tour = [0] + list(route) + [0]
+    return float(sum(cost[a, b] for a, b in zip(tour, tour[1:])))
+
+
+def _two_opt(tour: list[int], cost: np.ndarray, nbrs: np.ndarray) -> bool:
+    """Apply the first improving segment reversal; tour includes the depot at both ends."""
+    n = len(tour)
+    edges_fwd = cost[tour[:-1], tour[1:]]
+    edges_bwd = cost[tour[1:], tour[:-1]]
+    fwd = np.concatenate(([0.0], np.cumsum(edges_fwd)))
+    bwd = np.concatenate(([0.0], np.cumsum(edges_bwd)))
+    pos = {node: p for p, node in enumerate(tour[:-1])}
+
+    for i in range(1, n - 2):
+        a = tour[i - 1]
+        for c in nbrs[a]:
+            j = pos.get(int(c), 0)
+            if j <= i:
+                continue
+            # Balik tour[i..j]: edge (a, tour[i]) & (tour[j], tour[j+1]) diganti (a, tour[j]) & (tour[i], tour[j+1])
+            delta = (
+                cost[a, tour[j]] + cost[tour[i], tour[j + 1]] + (bwd[j] - bwd[i])
+                - cost[a, tour[i]] - cost[tour[j], tour[j + 1]] - (fwd[j] - fwd[i])
+            )
+            if delta < -1e-9:
+                tour[i:j + 1] = tour[i:j + 1][::-1]
+                return True
+    return False
+
+
+def _or_opt(tour: list[int], cost: np.ndarray, preds: list[list[int]], max_segment: int = 3) -> bool:
+    """Move a segment of 1..max_segment stops (same orientation) behind a cheap predecessor."""
+    n = len(tour)
+    pos = {node: p for p, node in enumerate(tour[:-1])}
+    for length in range(1, max_segment + 1):
+        for i in range(1, n - length):
+            s0, s1 = tour[i], tour[i + length - 1]
+            prev, nxt = tour[i - 1], tour[i + length]
+            removed = cost[prev, s0] + cost[s1, nxt] - cost[prev, nxt]
+            for c in preds[s0]:
+                p = pos.get(c)
+                if p is None or c == prev or i <= p < i + length:
+                    continue
+                c_next = tour[p + 1]
+                added = cost[c, s0] + cost[s1, c_next] - cost[c, c_next]
+                if added - removed < -1e-9:
+                    moved = tour[i:i + length]
+                    rest = tour[:i] + tour[i + length:]
+                    q = rest.index(c) + 1
+                    tour[:] = rest[:q] + moved + rest[q:]
+                    return True
+    return False
+
+
+def improve_route(route: list[int], cost: np.ndarray, neighbors: int = NEIGHBORS, max_rounds: int = 1000,
+                  budget=None) -> list[int]:
+    """2-opt + Or-opt until no improving move is left (or max_rounds moves / budget expired)."""
+    if len(route) < 3:
+        return list(route)
+    cost = _prepare(cost)
+    nbrs = neighbor_lists(cost, neighbors)
+    # preds[s]: node yang s termasuk tetangga terdekatnya (+ depot), kandidat posisi sisip Or-opt
+    preds = [[0] for _ in range(len(cost))]
+    for a, row in enumerate(nbrs):
+        for b in row:
+            preds[int(b)].append(a)
+    tour = [0] + list(route) + [0]
+    for _ in range(max_rounds):
+        if budget is not None and budget.expired():
+            break
+        if not (_two_opt(tour, cost, nbrs) or _or_opt(tour, cost, preds)):
+            break
+    return tour[1:-1]
+
+
+class _RouteState:
+    """One cluster's visits with prefix sums for O(1) segment exchange deltas."""
+
+    def __init__(self, cluster, cost: np.ndarray, rows: dict):
+        self.cluster = cluster
+        self.visits = list(cluster.visits)
+        self.cost = cost
+        self.rows = rows
+        self.refresh()
+
+    def refresh(self):
+        self.nodes = [self.rows[v.stop.id] for v in self.visits]
+        tour = [0] + self.nodes + [0]
+        self.tour = tour
+        self.prefix = np.concatenate(([0.0], np.cumsum(self.cost[tour[:-1], tour[1:]])))
+        self.load = np.concatenate(([0.0], np.cumsum([v.nilai_diangkut for v in self.visits])))
+        self.unload = np.concatenate(([0.0], np.cumsum([unload_time(v.nilai_diangkut) for v in self.visits])))
+        self.stop_ids = [v.stop.id for v in self.visits]
+
+    @property
+    def dist(self) -> float:
+        return self.prefix[-1]
+
+    def replaced(self, i: int, la: int, seg: "_RouteState", j: int, lb: int) -> float:
+        """Route km after replacing visits[i:i+la] with seg.visits[j:j+lb]."""
+        p, n = self.tour[i], self.tour[i + la + 1]
+        if lb:
+            inner = seg.prefix[j + lb] - seg.prefix[j + 1]
+            added = self.cost[p, seg.tour[j + 1]] + inner + self.cost[seg.tour[j + lb], n]
+        else:
+            added = self.cost[p, n]
+        return self.dist - (self.prefix[i + la + 1] - self.prefix[i]) + added
+
+
+def _positions(route: _RouteState, length: int):
+    return range(len(route.visits) - length + 1)
+
+
+def _try_exchange(r1: _RouteState, r2: _RouteState, max_segment: int) -> bool:
+    """First improving cross-exchange of r1[i:i+la] and r2[j:j+lb] (la or lb may be 0 = relocate)."""
+    before = r1.dist + r2.dist
+    cap1, cap2 = r1.cluster.vehicle.kapasitas, r2.cluster.vehicle.kapasitas
+    for la in range(max_segment + 1):
+        for lb in range(max_segment + 1):
+            if la == 0 and lb == 0:
+                continue
+            for i in _positions(r1, la):
+                load_a = r1.load[i + la] - r1.load[i]
+                unload_a = r1.unload[i + la] - r1.unload[i]
+                for j in _positions(r2, lb):
+                    load_b = r2.load[j + lb] - r2.load[j]
+                    if r1.load[-1] - load_a + load_b > cap1 or r2.load[-1] - load_b + load_a > cap2:
+                        continue
+                    d1 = r1.replaced(i, la, r2, j, lb)
+                    d2 = r2.replaced(j, lb, r1, i, la)
+                    if d1 + d2 >= before - 1e-6:
+                        continue
+                    unload_b = r2.unload[j + lb] - r2.unload[j]
+                    if travel_time(d1) + r1.unload[-1] - unload_a + unload_b > MAX_HOURS:
+                        continue
+                    if travel_time(d2) + r2.unload[-1] - unload_b + unload_a > MAX_HOURS:
+                        continue
+                    seg_a, seg_b = r1.visits[i:i + la], r2.visits[j:j + lb]
+                    # Split pickup: satu stop tidak boleh muncul dua kali di cluster yang sama
+                    if {v.stop.id for v in seg_b} & set(r1.stop_ids[:i] + r1.stop_ids[i + la:]):
+                        continue
+                    if {v.stop.id for v in seg_a} & set(r2.stop_ids[:j] + r2.stop_ids[j + lb:]):
+                        continue
+                    r1.visits[i:i + la] = seg_b
+                    r2.visits[j:j + lb] = seg_a
+                    r1.refresh()
+                    r2.refresh()
+                    return True
+    return False
+
+
+def _rebuild_cluster(route: _RouteState):
+    """Tulis ulang visits & total cluster dari urutan baru."""
+    cluster = route.cluster
+    cluster.visits = route.visits
+    cluster.total_load = cluster.total_time = cluster.total_distance = 0.0
+    for k, visit in enumerate(route.visits):
+        dist = float(route.cost[route.tour[k], route.tour[k + 1]])
+        visit.distance = dist
+        visit.travel_time = float(travel_time(dist))
+        cluster.total_load += visit.nilai_diangkut
+        cluster.total_time += visit.travel_time + unload_time(visit.nilai_diangkut)
+        cluster.total_distance += dist
+    if route.visits:
+        back = float(route.cost[route.tour[-2], 0])
+        cluster.total_time += float(travel_time(back))
+        cluster.total_distance += back
+
+
+def rebalance_plan(plan, legs, max_segment: int = 2, max_moves: int = 200, budget=None):
+    """Inter-route relocate / swap / cross-exchange between the clusters of each day.
+
+    Moves must keep every cluster within its vehicle capacity and MAX_HOURS and
+    strictly reduce the day's km; clusters emptied by the moves are dropped and
+    the day's cluster ids renumbered. Stops early once budget (anytime.Budget)
+    expires. Returns the number of applied moves.
+    """
+    cost = _prepare(legs.dist)
+    by_day = {}
+    for cluster in plan.clusters:
+        by_day.setdefault(cluster.tanggal, []).append(cluster)
+
+    moves = 0
+    kept = []
+    for tanggal, clusters in by_day.items():
+        routes = [_RouteState(c, cost, legs.rows) for c in clusters]
+        improved = True
+        while improved and moves < max_moves:
+            improved = False
+            for a, b in combinations(routes, 2):
+                if budget is not None and budget.expired():
+                    improved = False
+                    break
+                if (a.visits or b.visits) and _try_exchange(a, b, max_segment):
+                    improved = True
+                    moves += 1
+        cluster_id = 1
+        for route in routes:
+            if not route.visits:
+                continue
+            _rebuild_cluster(route)
+            route.cluster.cluster_id = cluster_id
+            cluster_id += 1
+            kept.append(route.cluster)
+
+    plan.clusters = kept
+    return moves
@@ -0,0 +1,179 @@
+"""Clarke-Wright savings planner, an alternative to the polar sweep.
+
+Same inputs and output as algorithms.sweep.plan_sweep (Stop/Fleet/LegTable in,
+SweepPlan out), so persistence and the API response are shared.
+"""
+import heapq
+from datetime import date
+from typing import Optional, Union
+
+import numpy as np
+
+from algorithms.clustering import DEPOT_COORD, MAX_HOURS
+from algorithms.sweep import (
+    MAX_CLUSTER_PER_DAY, MAX_EXTRA_WORKDAYS, MIN_PICKUP_KG, PENDING, SERVED,
+    DayLegs, Fleet, LegLookup, LegTable, PlannedCluster, PolarOrder, Stop, SweepPlan, Visit,
+    first_cluster_id, run_horizon, travel_time, unload_time,
+)
+
+
+class _Routes:
+    """Union-find over nodes; each root keeps its route's head, tail, load and duration."""
+
+    def __init__(self, demand: np.ndarray, duration: np.ndarray):
+        n = len(demand)
+        self.parent = list(range(n))
+        self.head = list(range(n))
+        self.tail = list(range(n))
+        self.next = [-1] * n
+        self.load = demand.tolist()
+        self.time = duration.tolist()
+
+    def find(self, i: int) -> int:
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def merge(self, i: int, j: int, time: float):
+        """Append the route starting at j after the route ending at i."""
+        ri, rj = self.find(i), self.find(j)
+        self.next[i] = j
+        self.parent[rj] = ri
+        self.tail[ri] = self.tail[rj]
+        self.load[ri] += self.load[rj]
+        self.time[ri] = time
+
+    def routes(self) -> list[list[int]]:
+        result = []
+        for r in range(len(self.parent)):
+            if self.parent[r] == r:
+                route, i = [], self.head[r]
+                while i != -1:
+                    route.append(i)
+                    i = self.next[i]
+                result.append(route)
+        return result
+
+
+def savings_routes(nodes: np.ndarray, demand: np.ndarray, legs: DayLegs, capacity: float) -> list[list[int]]:
+    """Build routes over nodes (positions in the stop list) with the Clarke-Wright savings heuristic.
+
+    Saving of serving j right after i instead of via the depot:
+    s(i, j) = d(i, 0) + d(0, j) - d(i, j). Merges must keep load <= capacity and
+    the route (incl. unload and the trip home) within MAX_HOURS.
+    """
+    rows = legs.rows[nodes]
+    out_time, back_time = legs.out_time[nodes], legs.back_time[nodes]
+    dist = legs.dist[np.ix_(rows, rows)]
+    leg_time = travel_time(dist)
+    routes = _Routes(demand, out_time + unload_time(demand) + back_time)
+
+    with np.errstate(invalid="ignore"):
+        saving = legs.back_dist[nodes][:, None] + legs.out_dist[nodes][None, :] - dist
+        np.fill_diagonal(saving, np.nan)
+        ii, jj = np.nonzero(saving > 0)  # NaN (tidak bisa dirute) ikut tersaring
+    heap = list(zip((-saving[ii, jj]).tolist(), ii.tolist(), jj.tolist()))
+    heapq.heapify(heap)
+
+    while heap:
+        _, i, j = heapq.heappop(heap)
+        ri, rj = routes.find(i), routes.find(j)
+        if ri == rj or routes.tail[ri] != i or routes.head[rj] != j:
+            continue
+        if routes.load[ri] + routes.load[rj] > capacity:
+            continue
+        time = routes.time[ri] + routes.time[rj] - back_time[i] - out_time[j] + leg_time[i, j]
+        if time > MAX_HOURS:
+            continue
+        routes.merge(i, j, float(time))
+
+    return [[int(nodes[k]) for k in route] for route in routes.routes()]
+
+
+def pick_vehicle(vehicles: list[Fleet], load: float) -> Fleet:
+    """Kendaraan terkecil yang muat; urutan input jadi tie-break."""
+    fitting = [v for v in vehicles if v.kapasitas >= load]
+    return min(fitting, key=lambda v: v.kapasitas) if fitting else max(vehicles, key=lambda v: v.kapasitas)
+
+
+def plan_savings(stops: list[Stop], vehicles: list[Fleet], legs: Union[LegTable, LegLookup], depot: tuple = DEPOT_COORD,
+                 max_clusters_per_day: int = MAX_CLUSTER_PER_DAY,
+                 max_extra_workdays: int = MAX_EXTRA_WORKDAYS, start_date: Optional[date] = None,
+                 used_cluster_ids: Optional[dict] = None) -> SweepPlan:
+    """Plan the horizon with Clarke-Wright savings instead of the sweep.
+
+    Each day runs savings rounds over the open stops until max_clusters_per_day
+    routes are used; a stop with more kg than the largest vehicle is served in
+    chunks (split pickup) over several routes/rounds. Routes with the most kg go
+    first and get the smallest vehicle they fit in. used_cluster_ids works as in
+    plan_sweep.
+    """
+    if not isinstance(legs, LegTable):
+        legs = LegTable.from_lookup(depot, stops, legs)
+    stops = list(stops)
+    plan = SweepPlan(clusters=[], stops=stops)
+    if not stops or not vehicles:
+        return plan
+
+    order = PolarOrder(stops)
+    day_legs = DayLegs(legs, stops)
+    capacity = max(v.kapasitas for v in vehicles)
+
+    def plan_day(current_date: date):
+        cluster_id_harian = first_cluster_id(used_cluster_ids, current_date)
+        while cluster_id_harian <= max_clusters_per_day:
+            nodes = np.array([i for i, s in order if s.tanggal <= current_date], dtype=int)
+            if not len(nodes):
+                break
+            demand = np.minimum(day_legs.remaining[nodes], capacity)
+            with np.errstate(invalid="ignore"):
+                alone = day_legs.out_time[nodes] + unload_time(demand) + day_legs.back_time[nodes]
+                ok = (day_legs.remaining[nodes] >= MIN_PICKUP_KG) & (alone <= MAX_HOURS)
+            nodes, demand = nodes[ok], demand[ok]
+            if not len(nodes):
+                break
+
+            routes = savings_routes(nodes, demand, day_legs, capacity)
+            routes.sort(key=lambda r: -sum(min(day_legs.remaining[i], capacity) for i in r))
+            for route in routes[:max_clusters_per_day - cluster_id_harian + 1]:
+                plan.clusters.append(_route_cluster(route, order, day_legs, vehicles, capacity,
+                                                    current_date, cluster_id_harian))
+                cluster_id_harian += 1
+
+    run_horizon(order, start_date or min(s.tanggal for s in stops), max_extra_workdays, plan_day)
+    return plan
+
+
+def _route_cluster(route: list[int], order: PolarOrder, legs: DayLegs, vehicles: list[Fleet], capacity: float,
+                   tanggal: date, cluster_id: int) -> PlannedCluster:
+    load = sum(min(legs.remaining[i], capacity) for i in route)
+    cluster = PlannedCluster(cluster_id=cluster_id, tanggal=tanggal, vehicle=pick_vehicle(vehicles, load))
+    prev = -1  # -1 = depot
+
+    for i in route:
+        stop = order.stops[i]
+        nilai_awal = float(legs.remaining[i])
+        muatan = min(nilai_awal, capacity)
+        nilai_akhir = nilai_awal - muatan
+        dist = float(legs.out_dist[i] if prev < 0 else legs.dist[legs.rows[prev], legs.rows[i]])
+        leg_time = float(travel_time(dist))
+        legs.remaining[i] = nilai_akhir
+
+        stop.nilai_ekspektasi_awal = nilai_awal
+        stop.nilai_ekspektasi_akhir = nilai_akhir
+        stop.tanggal = tanggal
+        stop.status = SERVED if nilai_akhir == 0 else PENDING
+        stop.dirty = True
+        if stop.status == SERVED:
+            order.remove(i)
+
+        cluster.visits.append(Visit(stop, nilai_awal, muatan, nilai_akhir, stop.status, leg_time, dist))
+        cluster.total_load += muatan
+        cluster.total_time += leg_time + unload_time(muatan)
+        cluster.total_distance += dist
+        prev = i
+
+    cluster.total_time += float(legs.back_time[prev])
+    cluster.total_distance += float(legs.back_dist[prev])
+    return cluster
@@ -0,0 +1,467 @@
+"""DB-free sweep planner.
+
+Works on plain dataclasses and a dense leg table (NumPy), so a whole clustering
+run is pure arithmetic over memory; the caller persists the returned plan in one
+transaction (see services.cluster_service.persist_sweep_plan).
+"""
+import copy
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Optional, Union
+
+import numpy as np
+
+from algorithms.clustering import DEPOT_COORD, MAX_HOURS, SPEED, calculate_red_light_time
+
+SERVED = "Sudah di-cluster"
+PENDING = "Belum di-cluster"
+MIN_PICKUP_KG = 25  # sisa muatan di bawah ini tidak dijemput
+MAX_CLUSTER_PER_DAY = 3
+MAX_EXTRA_WORKDAYS = 4  # maksimal 5 hari kerja per run
+
+# Ukuran pool proses yang dipakai bersama semua request (juga batas worker per request)
+SWEEP_WORKERS = max(1, int(os.getenv("SWEEP_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+LegLookup = Callable[[tuple, tuple], tuple]
+
+
+def next_workday(d: date) -> date:
+    d += timedelta(days=1)
+    while d.weekday() == 6:  # skip Minggu
+        d += timedelta(days=1)
+    return d
+
+
+def add_workdays(start_date: date, workdays: int) -> date:
+    current = start_date
+    for _ in range(workdays):
+        current = next_workday(current)
+    return current
+
+
+def travel_time(dist_km):
+    """Jam perjalanan termasuk penalti lampu merah (float atau ndarray)."""
+    return dist_km / SPEED + calculate_red_light_time(dist_km)
+
+
+def unload_time(kg: float) -> float:
+    """Waktu bongkar muat dalam jam (4.26 menit per 20 kg)."""
+    return ((kg / 20.0) * 4.26) / 60
+
+
+@dataclass
+class Stop:
+    id: int
+    lon: float
+    lat: float
+    sudut_polar: float
+    tanggal: date
+    nilai_ekspektasi: float
+    nilai_ekspektasi_awal: Optional[float]
+    nilai_ekspektasi_akhir: float
+    status: str = PENDING
+    nama_pengepul: Optional[str] = None
+    alamat: Optional[str] = None
+    dirty: bool = False
+
+    @property
+    def coord(self) -> tuple[float, float]:
+        return self.lon, self.lat
+
+    @property
+    def is_open(self) -> bool:
+        return self.nilai_ekspektasi_akhir > 0 and self.status != SERVED
+
+    @classmethod
+    def from_orm(cls, loc) -> "Stop":
+        return cls(
+            id=loc.id,
+            lon=float(loc.longitude),
+            lat=float(loc.latitude),
+            sudut_polar=loc.sudut_polar or 0.0,
+            tanggal=loc.tanggal_cluster,
+            nilai_ekspektasi=float(loc.nilai_ekspektasi or 0.0),
+            nilai_ekspektasi_awal=loc.nilai_ekspektasi_awal,
+            nilai_ekspektasi_akhir=float(loc.nilai_ekspektasi_akhir or 0.0),
+            status=loc.status or PENDING,
+            nama_pengepul=loc.nama_pengepul,
+            alamat=loc.alamat,
+        )
+
+
+@dataclass
+class Fleet:
+    id: int
+    nama_kendaraan: str
+    kapasitas: float
+
+    @classmethod
+    def from_orm(cls, vehicle) -> "Fleet":
+        return cls(vehicle.id, vehicle.nama_kendaraan, float(vehicle.kapasitas_kendaraan))
+
+
+@dataclass
+class Visit:
+    stop: Stop
+    nilai_awal: float
+    nilai_diangkut: float
+    nilai_akhir: float
+    status: str
+    travel_time: float
+    distance: float
+
+
+@dataclass
+class PlannedCluster:
+    cluster_id: int
+    tanggal: date
+    vehicle: Fleet
+    visits: list[Visit] = field(default_factory=list)
+    total_time: float = 0.0
+    total_distance: float = 0.0
+    total_load: float = 0.0
+
+
+@dataclass
+class SweepPlan:
+    clusters: list[PlannedCluster]
+    stops: list[Stop]
+
+    @property
+    def dirty_stops(self) -> list[Stop]:
+        return [s for s in self.stops if s.dirty]
+
+    @property
+    def total_distance(self) -> float:
+        return sum(c.total_distance for c in self.clusters)
+
+    @property
+    def total_time(self) -> float:
+        return sum(c.total_time for c in self.clusters)
+
+    @property
+    def unserved_kg(self) -> float:
+        return sum(s.nilai_ekspektasi_akhir for s in self.stops if s.is_open)
+
+    def score(self) -> tuple:
+        """Lebih kecil lebih baik: sisa muatan dulu, baru jarak lalu waktu total."""
+        return round(self.unserved_kg, 3), round(self.total_distance, 3), round(self.total_time, 4)
+
+
+class LegTable:
+    """Dense leg distances in km (NaN = unroutable); row/col 0 is the depot.
+
+    rows maps Stop.id to its row in dist.
+    """
+
+    def __init__(self, dist: np.ndarray, rows: dict[int, int]):
+        self.dist = np.asarray(dist, dtype=float)
+        self.rows = rows
+
+    @classmethod
+    def from_arrays(cls, durations: np.ndarray, distances: np.ndarray, stops: list[Stop]) -> "LegTable":
+        """Wrap depot-first matrices whose rows 1..n follow stops."""
+        dist = np.array(distances, dtype=float)
+        dist[np.isnan(np.asarray(durations, dtype=float))] = np.nan
+        return cls(dist, {s.id: i + 1 for i, s in enumerate(stops)})
+
+    @classmethod
+    def from_route_matrix(cls, matrix) -> "LegTable":
+        """Share a utils.route_matrix.RouteMatrix (depot at row 0, rows keyed by stop id)."""
+        dist = matrix.distances.copy()
+        dist[np.isnan(matrix.durations)] = np.nan
+        return cls(dist, dict(matrix.index))
+
+    @classmethod
+    def from_lookup(cls, depot: tuple, stops: list[Stop], lookup: LegLookup) -> "LegTable":
+        points = [depot] + [s.coord for s in stops]
+        dist = np.zeros((len(points), len(points)))
+        for i, a in enumerate(points):
+            for j, b in enumerate(points):
+                if i != j:
+                    dur, d = lookup(a, b)
+                    dist[i, j] = np.nan if dur is None or d is None else d
+        return cls(dist, {s.id: i + 1 for i, s in enumerate(stops)})
+
+
+class DayLegs:
+    """Per-run vectors over the planner's stop list: table rows, sisa muatan and depot legs."""
+
+    def __init__(self, legs: LegTable, stops: list[Stop]):
+        self.dist = legs.dist
+        self.rows = np.array([legs.rows[s.id] for s in stops], dtype=int)
+        self.remaining = np.array([s.nilai_ekspektasi_awal or s.nilai_ekspektasi for s in stops], dtype=float)
+        self.out_dist = self.dist[0, self.rows]   # depot -> stop
+        self.back_dist = self.dist[self.rows, 0]  # stop -> depot
+        self.back_time = travel_time(self.back_dist)
+        self.out_time = travel_time(self.out_dist)
+
+
+class PolarOrder:
+    """Doubly linked active set over stops pre-sorted by sudut polar (menurun).
+
+    Sorting happens once per run; fully served stops are unlinked in O(1), so
+    each vehicle pass only walks stops that are still open.
+    """
+
+    def __init__(self, stops: list[Stop]):
+        self.stops = stops
+        n = len(stops)
+        self.next = list(range(1, n + 1))
+        self.prev = list(range(-1, n - 1))
+        self.head = 0 if n else n
+        self.linked = [True] * n
+        self.size = n
+        for i, stop in enumerate(stops):
+            if not stop.is_open:
+                self.remove(i)
+
+    def remove(self, i: int):
+        if not self.linked[i]:
+            return
+        self.linked[i] = False
+        self.size -= 1
+        p, n = self.prev[i], self.next[i]
+        if p >= 0:
+            self.next[p] = n
+        else:
+            self.head = n
+        if n < len(self.stops):
+            self.prev[n] = p
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __iter__(self):
+        """Yield (index, stop); the current stop may be removed while iterating."""
+        i = self.head
+        while i < len(self.stops):
+            nxt = self.next[i]
+            yield i, self.stops[i]
+            i = nxt
+
+
+def _fill_vehicle(order: PolarOrder, vehicle: Fleet, legs: DayLegs, tanggal: date,
+                  cluster_id: int) -> Optional[PlannedCluster]:
+    """Isi satu kendaraan mengikuti urutan sudut polar; return None kalau tidak ada yang masuk.
+
+    Semua kandidat sisa dicek sekaligus (kapasitas, MAX_HOURS incl. pulang ke
+    depot, minimum muatan); kandidat layak pertama diambil, lalu ulang dari situ.
+    """
+    cluster = PlannedCluster(cluster_id=cluster_id, tanggal=tanggal, vehicle=vehicle)
+    cand = np.array([i for i, stop in order if stop.tanggal <= tanggal], dtype=int)
+    prev = -1  # -1 = depot
+
+    while len(cand):
+        nilai_awal = legs.remaining[cand]
+        dist = legs.out_dist[cand] if prev < 0 else legs.dist[legs.rows[prev], legs.rows[cand]]
+        muatan = np.minimum(vehicle.kapasitas - cluster.total_load, nilai_awal)
+        waktu_di_lokasi = travel_time(dist) + unload_time(muatan)
+        # NaN (leg tidak bisa dirute) otomatis gagal di perbandingan
+        with np.errstate(invalid="ignore"):
+            feasible = (
+                (nilai_awal >= MIN_PICKUP_KG)
+                & (muatan > 0)
+                & (cluster.total_time + waktu_di_lokasi + legs.back_time[cand] <= MAX_HOURS)
+            )
+        hits = np.flatnonzero(feasible)
+        if not len(hits):
+            break
+
+        j = hits[0]
+        i = int(cand[j])
+        cand = cand[j + 1:]
+        stop = order.stops[i]
+
+        nilai_akhir = float(nilai_awal[j] - muatan[j])
+        legs.remaining[i] = nilai_akhir
+
+        stop.nilai_ekspektasi_awal = float(nilai_awal[j])
+        stop.nilai_ekspektasi_akhir = nilai_akhir
+        stop.tanggal = tanggal
+        stop.status = SERVED if nilai_akhir == 0 else PENDING
+        stop.dirty = True
+        if stop.status == SERVED:
+            order.remove(i)
+
+        cluster.visits.append(Visit(
+            stop, float(nilai_awal[j]), float(muatan[j]), nilai_akhir, stop.status,
+            float(travel_time(dist[j])), float(dist[j]),
+        ))
+        cluster.total_load += float(muatan[j])
+        cluster.total_time += float(waktu_di_lokasi[j])
+        cluster.total_distance += float(dist[j])
+        prev = i
+
+    if not cluster.visits:
+        return None
+
+    cluster.total_time += float(legs.back_time[prev])
+    cluster.total_distance += float(legs.back_dist[prev])
+    return cluster
+
+
+def plan_sweep(stops: list[Stop], vehicles: list[Fleet], legs: Union[LegTable, LegLookup], depot: tuple = DEPOT_COORD,
+               max_clusters_per_day: int = MAX_CLUSTER_PER_DAY,
+               max_extra_workdays: int = MAX_EXTRA_WORKDAYS, start_date: Optional[date] = None,
+               start_angle: Optional[float] = None, descending: bool = True,
+               used_cluster_ids: Optional[dict] = None) -> SweepPlan:
+    """Sweep stops (sudut polar menurun) into vehicle clusters day by day.
+
+    By default the sweep starts at the highest sudut polar; start_angle rotates
+    the starting ray and descending=False sweeps the other way round.
+
+    Stops are mutated in place (sisa muatan, tanggal, status) and flagged dirty;
+    nothing touches the database. legs is a LegTable over the stops, or a
+    lookup callable used to build one. Stops dated after start_date (default:
+    the earliest stop) only become eligible on their own day, so a whole
+    horizon plans in one call. used_cluster_ids maps a date to the highest
+    cluster_id already saved that day; numbering continues after it and those
+    clusters count towards max_clusters_per_day.
+    """
+    if not isinstance(legs, LegTable):
+        legs = LegTable.from_lookup(depot, stops, legs)
+    if start_angle is None:
+        stops = sorted(stops, key=lambda s: s.sudut_polar, reverse=descending)
+    elif descending:
+        stops = sorted(stops, key=lambda s: (start_angle - s.sudut_polar) % 360)
+    else:
+        stops = sorted(stops, key=lambda s: (s.sudut_polar - start_angle) % 360)
+    plan = SweepPlan(clusters=[], stops=stops)
+    if not stops:
+        return plan
+
+    order = PolarOrder(stops)
+    day_legs = DayLegs(legs, stops)
+
+    def plan_day(current_date: date):
+        cluster_id_harian = first_cluster_id(used_cluster_ids, current_date)
+        while cluster_id_harian <= max_clusters_per_day:
+            any_vehicle_used = False
+
+            for vehicle in vehicles:
+                if not order or cluster_id_harian > max_clusters_per_day:
+                    break
+
+                cluster = _fill_vehicle(order, vehicle, day_legs, current_date, cluster_id_harian)
+                if cluster is not None:
+                    plan.clusters.append(cluster)
+                    any_vehicle_used = True
+                    cluster_id_harian += 1
+
+            if not any_vehicle_used:
+                break
+
+    run_horizon(order, start_date or min(s.tanggal for s in stops), max_extra_workdays, plan_day)
+    return plan
+
+
+def first_cluster_id(used_cluster_ids: Optional[dict], tanggal: date) -> int:
+    """cluster_id pertama yang masih bebas di tanggal itu (cluster tersimpan ikut jatah harian)."""
+    return (used_cluster_ids or {}).get(tanggal, 0) + 1
+
+
+def run_horizon(order: PolarOrder, current_date: date, max_extra_workdays: int, plan_day: Callable[[date], None]):
+    """Day loop shared by the planners: skip Minggu, stop after the horizon, roll leftovers forward."""
+    max_end_date = add_workdays(current_date, max_extra_workdays)
+
+    while order:
+        if current_date > max_end_date:
+            print(f"⏹️ Maksimal {max_extra_workdays + 1} hari tercapai, stop di tanggal: {current_date}")
+            break
+
+        if current_date.weekday() == 6:  # skip Minggu
+            current_date += timedelta(days=1)
+            continue
+
+        plan_day(current_date)
+
+        # Sisa yang belum terangkut digeser ke hari kerja berikutnya
+        next_date = next_workday(current_date)
+        for _, s in order:
+            if s.tanggal <= current_date:
+                s.tanggal = next_date
+                s.dirty = True
+
+        current_date = next_date
+
+
+def start_angles(stops: list[Stop], n: int) -> list[float]:
+    """n starting rays spread evenly over the stops' polar order (the first is the usual start)."""
+    angles = sorted({s.sudut_polar for s in stops}, reverse=True)
+    if not angles:
+        return []
+    n = min(n, len(angles))
+    return [angles[k * len(angles) // n] for k in range(n)]
+
+
+_POOL: Optional[ProcessPoolExecutor] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Pool proses sekali buat, dipakai ulang semua request.
+
+    Worker dibuat lewat forkserver/spawn, bukan fork: proses API punya thread lain
+    (ors-client event loop, nightly warmer) yang lock-nya bisa ikut tersalin terkunci.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _POOL = ProcessPoolExecutor(max_workers=SWEEP_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _POOL
+
+
+def _reset_pool(pool: ProcessPoolExecutor):
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is pool:
+            _POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _plan_start(stops, vehicles, legs, kwargs, start: tuple) -> SweepPlan:
+    angle, descending = start
+    return plan_sweep(copy.deepcopy(stops), vehicles, legs, start_angle=angle, descending=descending, **kwargs)
+
+
+def _run_starts(stops, vehicles, legs, kwargs, starts: list[tuple]) -> list[SweepPlan]:
+    # Satu task per worker: stops, fleet & leg table cukup dikirim sekali per chunk
+    return [_plan_start(stops, vehicles, legs, kwargs, start) for start in starts]
+
+
+def plan_multi_start(stops: list[Stop], vehicles: list[Fleet], legs: Union[LegTable, LegLookup], starts: int,
+                     workers: int = SWEEP_WORKERS, depot: tuple = DEPOT_COORD, **kwargs) -> SweepPlan:
+    """Run the sweep from `starts` rotated angles in both directions and keep the best plan.
+
+    Runs are split into at most SWEEP_WORKERS chunks on the shared process pool
+    (each chunk receives the leg table once); the winner has the least unserved kg,
+    then the lowest total distance and time.
+    The input stops are left untouched; the returned plan holds its own copies.
+    """
+    if not isinstance(legs, LegTable):
+        legs = LegTable.from_lookup(depot, stops, legs)
+    kwargs["depot"] = depot
+    runs = [(None, True)] + [(angle, d) for angle in start_angles(stops, starts) for d in (True, False)][1:]
+
+    workers = min(workers, SWEEP_WORKERS, len(runs))
+    plans = None
+    if workers > 1:
+        pool = _get_pool()
+        try:
+            size = -(-len(runs) // workers)  # chunk berurutan, jadi tie-break sama dengan jalur serial
+            chunks = [pool.submit(_run_starts, stops, vehicles, legs, kwargs, runs[k:k + size])
+                      for k in range(0, len(runs), size)]
+            plans = [plan for chunk in chunks for plan in chunk.result()]
+        except BrokenProcessPool:
+            _reset_pool(pool)  # worker mati; request berikutnya dapat pool baru, yang ini jalan serial
+    if plans is None:
+        plans = _run_starts(stops, vehicles, legs, kwargs, runs)
+
+    return min(plans, key=SweepPlan.score)
@@ -1,13 +1,28 @@
-from functools import lru_cache
-import os
+from functools import partial
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from models import DailyPengepul, Location, Vehicle, Cluster, ClusterRoute, TimeDistanceMatrix
+from models import DailyPengepul, Vehicle, Cluster, ClusterRoute
 from database import get_db
 from fastapi.responses import JSONResponse
-from utils.routing import ors_directions_request, precompute_matrix
-import json
-from datetime import date, datetime, timedelta
+from utils.day_matrix import DayMatrix
+from utils.spatial import NN_CANDIDATES, SpatialIndex
+from utils.route_matrix import DEPOT_ID, RouteMatrix
+from services.matrix_store import find_time_distance_matrix
+from services.cluster_service import (
+    day_clusters_query, has_unclustered_stops, load_day_clusters, load_horizon_stops, load_unclustered_stops,
+    load_used_cluster_ids, persist_insertions, persist_sweep_plan,
+    prefetch_route_data, vehicles_by_id,
+)
+from services.persistence import insert_rows, write_transaction
+from algorithms.insertion import insert_stops
+from algorithms.anytime import Budget, anytime_plan
+from algorithms.local_search import improve_route, rebalance_plan, route_cost
+from algorithms.exact import HELD_KARP_MAX_STOPS, exact_order
+from algorithms.savings import plan_savings
+from algorithms.sweep import MAX_CLUSTER_PER_DAY, MAX_EXTRA_WORKDAYS, Fleet, LegTable, Stop, add_workdays, plan_multi_start, plan_sweep
+import numpy as np
+from utils.providers import get_provider
+from datetime import date, datetime
 from collections import defaultdict
 from typing import List, Optional
 from sqlalchemy.orm import joinedload
@@ -32,344 +47,319 @@ def calculate_red_light_time(distance_km: float) -> float:
     return (distance_km / 10) * RED_LIGHT_TIME
 
 
-def standard_response(data=None, message: str = "Success", status_code: int = 200):
-    return JSONResponse(status_code=status_code, content={"message": message, "data": data})
+def standard_response(data=None, message: str = "Success", status_code: int = 200, **extra):
+    return JSONResponse(status_code=status_code, content={"message": message, "data": data, **extra})
 
-MAX_CLUSTER_PER_DAY = 3
+STRATEGIES = {"sweep": plan_sweep, "savings": plan_savings}
 
-MAX_CLUSTER_PER_DAY = 3
+def build_route_matrix(locations, provider: Optional[str] = None, db: Optional[Session] = None,
+                       tanggal: Optional[date] = None) -> RouteMatrix:
+    """Satu RouteMatrix depot + semua lokasi hari itu (key = daily_pengepul id), dipakai bersama sweep & routing.
 
-def add_workdays(start_date, workdays):
-    days_added = 0
-    current = start_date
-    while days_added < workdays:
-        current += timedelta(days=1)
-        if current.weekday() != 6:  # Bukan Minggu
-            days_added += 1
-    return current
+    Kalau db & tanggal diisi, matrix hasil /distance_matrix/generate dipakai ulang,
+    selama koordinat lokasinya masih sama. Matrix tersimpan dibuat dengan provider
+    default, jadi tidak dipakai kalau provider diminta eksplisit.
+    """
+    points = [(DEPOT_LON, DEPOT_LAT)]
+    ids = [DEPOT_ID]
+    seen = {DEPOT_ID}
+    for loc in locations:
+        if isinstance(loc, dict):
+            loc_id, coord = loc.get("daily_pengepul_id") or loc.get("id"), (loc["longitude"], loc["latitude"])
+        else:
+            loc_id, coord = loc.id, (loc.longitude, loc.latitude)
+        if loc_id in seen:
+            continue  # split pickup: lokasi sama di beberapa cluster
+        seen.add(loc_id)
+        ids.append(loc_id)
+        points.append(coord)
+
+    if db is not None and tanggal is not None and provider is None:
+        stored = find_time_distance_matrix(db, tanggal, ids, points)
+        if stored is not None:
+            stored_ids, time_matrix, distance_matrix = stored
+            pos = {loc_id: i for i, loc_id in enumerate(stored_ids)}
+            rows = np.ix_([pos[loc_id] for loc_id in ids], [pos[loc_id] for loc_id in ids])
+            return RouteMatrix(ids, points, time_matrix[rows], distance_matrix[rows])
+
+    return RouteMatrix.from_day_matrix(DayMatrix.build(points, get_provider(provider)), ids, points)
+
+def sweep_algorithm(locations: List[DailyPengepul], vehicles: List[Vehicle], db: Session, matrix: Optional[RouteMatrix] = None,
+                    start_date: Optional[date] = None, check_existing: bool = True, starts: int = 1,
+                    strategy: str = "sweep", rebalance: bool = False, budget: Optional[Budget] = None,
+                    used_cluster_ids: Optional[dict] = None):
+    """Planning murni di memori (algorithms.sweep), lalu satu kali simpan ke DB.
+
+    used_cluster_ids: cluster_id tertinggi yang sudah tersimpan per tanggal, supaya
+    cluster baru tidak memakai ulang id dan tidak melewati MAX_CLUSTER_PER_DAY.
+    """
+    if not locations:
+        return [], []
+
+    if matrix is None:
+        matrix = build_route_matrix(locations)
+
+    stops = [Stop.from_orm(loc) for loc in locations]
+    legs = LegTable.from_route_matrix(matrix)
+    planner = STRATEGIES[strategy]
+    if strategy == "sweep" and starts > 1:
+        planner = partial(plan_multi_start, starts=starts)
+    options = dict(depot=(DEPOT_LON, DEPOT_LAT), max_clusters_per_day=MAX_CLUSTER_PER_DAY, start_date=start_date,
+                   used_cluster_ids=used_cluster_ids)
+    fleets = [Fleet.from_orm(v) for v in vehicles]
+    if budget is not None:
+        plan = anytime_plan(stops, fleets, legs, planner, budget, rebalance=rebalance,
+                            restarts=strategy == "sweep", **options)
+    else:
+        plan = planner(stops, fleets, legs, **options)
+        if rebalance:
+            rebalance_plan(plan, legs)
+    persist_sweep_plan(db, plan, check_existing=check_existing)
 
-def sweep_algorithm(locations: List[DailyPengepul], vehicles: List[Vehicle], db: Session):
     hasil_cluster = []
-    remaining_locations = sorted(locations[:], key=lambda l: l.sudut_polar, reverse=True)
-
-    if not remaining_locations:
-        return hasil_cluster, []
-
-    current_date = remaining_locations[0].tanggal_cluster
-    max_end_date = add_workdays(current_date, 4)
-    last_remaining = {}
-
-    while any(loc.nilai_ekspektasi_akhir > 0 and loc.status != "Sudah di-cluster" for loc in remaining_locations):
-        if current_date > max_end_date:
-            print(f"⏹️ Maksimal 5 hari tercapai, stop di tanggal: {current_date}")
-            break
-
-        if current_date.weekday() == 6:  # skip Minggu
-            current_date += timedelta(days=1)
-            continue
-
-        print(f"\n📆 Mulai clustering tanggal: {current_date}")
-        print(f"📍 Total lokasi sisa: {len(remaining_locations)}")
-
-        cluster_hari_ini = 0
-        cluster_id_harian = 1
-        used_ids_today = set()
-
-        while cluster_hari_ini < MAX_CLUSTER_PER_DAY:
-            any_vehicle_used = False
-
-            for vehicle in vehicles:
-                kapasitas = vehicle.kapasitas_kendaraan
-                total_load = total_time = total_distance = 0.0
-                prev_loc = None
-                current_cluster = []
-                used_locations = []
-
-                sorted_locations = sorted(
-                    [
-                        loc for loc in remaining_locations
-                        if loc.nilai_ekspektasi_akhir > 0 and
-                        loc.status != "Sudah di-cluster" and
-                        loc.tanggal_cluster <= current_date and
-                        loc.id not in used_ids_today
-                    ],
-                    key=lambda l: l.sudut_polar,
-                    reverse=True
-                )
-
-                if not sorted_locations:
-                    continue
-
-                for loc in sorted_locations:
-                    nilai_awal = last_remaining.get(loc.id)
-                    if nilai_awal is None:
-                        nilai_awal = loc.nilai_ekspektasi_awal or loc.nilai_ekspektasi  # Handle null
-
-                    if nilai_awal < 25:
-                        continue  # Skip lokasi dengan sisa muatan < 25kg
-
-                    start_coord = (prev_loc.longitude, prev_loc.latitude) if prev_loc else (DEPOT_LON, DEPOT_LAT)
-                    end_coord = (loc.longitude, loc.latitude)
-                    dur, dist = ors_directions_request(start_coord, end_coord)
-                    if dur is None or dist is None:
-                        continue
-
-                    red_light = calculate_red_light_time(dist)
-                    travel_time = dist / SPEED + red_light
-
-                    muatan_bisa_diangkut = min(kapasitas - total_load, nilai_awal)
-                    if muatan_bisa_diangkut <= 0:
-                        continue
-
-                    waktu_unload = ((muatan_bisa_diangkut / 20.0) * 4.26) / 60
-                    waktu_di_lokasi = travel_time + waktu_unload
-
-                    dur_back, dist_back = ors_directions_request(end_coord, (DEPOT_LON, DEPOT_LAT))
-                    if dur_back is None or dist_back is None:
-                        continue
-
-                    travel_back_time = dist_back / SPEED + calculate_red_light_time(dist_back)
-                    simulasi_total_time = total_time + waktu_di_lokasi + travel_back_time
-
-                    nilai_akhir = nilai_awal - muatan_bisa_diangkut
-
-                    if simulasi_total_time <= MAX_HOURS:
-                        last_remaining[loc.id] = nilai_akhir
-
-                        loc.nilai_ekspektasi_awal = nilai_awal
-                        loc.nilai_diangkut = muatan_bisa_diangkut
-                        loc.nilai_ekspektasi_akhir = nilai_akhir
-                        loc.tanggal_cluster = current_date
-                        loc.status = "Sudah di-cluster" if nilai_akhir == 0 else "Belum di-cluster"
-                        db.add(loc)
-
-                        current_cluster.append({
-                            "id": loc.id,
-                            "nama_pengepul": loc.nama_pengepul,
-                            "alamat": loc.alamat,
-                            "nilai_ekspektasi": float(loc.nilai_ekspektasi),
-                            "nilai_ekspektasi_awal": float(nilai_awal),
-                            "nilai_diangkut": float(muatan_bisa_diangkut),
-                            "nilai_ekspektasi_akhir": float(nilai_akhir),
-                            "status": loc.status,
-                            "latitude": float(loc.latitude),
-                            "longitude": float(loc.longitude),
-                            "waktu_tempuh": format_waktu(travel_time),
-                            "jarak_tempuh_km": round(float(dist), 2),
-                        })
-
-                        total_load += muatan_bisa_diangkut
-                        total_time += waktu_di_lokasi
-                        total_distance += dist
-                        used_locations.append(loc)
-                        prev_loc = loc
-
-                if used_locations:
-                    last = used_locations[-1]
-                    _, dist_back_last = ors_directions_request((last.longitude, last.latitude), (DEPOT_LON, DEPOT_LAT))
-                    total_time += dist_back_last / SPEED + calculate_red_light_time(dist_back_last)
-                    total_distance += dist_back_last
-
-                    for idx, loc in enumerate(used_locations):
-                        if (loc.id, cluster_id_harian, current_date) in used_ids_today:
-                            continue
-
-                        existing = db.query(Cluster).filter_by(
-                            daily_pengepul_id=loc.id,
-                            tanggal_cluster=current_date,
-                            cluster_id=cluster_id_harian
-                        ).first()
-                        if existing:
-                            continue
-
-                        cluster = Cluster(
-                            cluster_id=cluster_id_harian,
-                            daily_pengepul_id=loc.id,
-                            vehicle_id=vehicle.id,
-                            nama_pengepul=loc.nama_pengepul,
-                            alamat=loc.alamat,
-                            nilai_ekspektasi=loc.nilai_ekspektasi,
-                            nilai_ekspektasi_awal=loc.nilai_ekspektasi_awal,
-                            nilai_ekspektasi_akhir=loc.nilai_ekspektasi_akhir,
-                            latitude=loc.latitude,
-                            longitude=loc.longitude,
-                            nilai_diangkut=loc.nilai_diangkut,
-                            tanggal_cluster=current_date,
-                            sequence=idx
-                        )
-                        db.add(cluster)
-                        used_ids_today.add((loc.id, cluster_id_harian, current_date))
-
-                    hasil_cluster.append({
-                        "cluster_id": cluster_id_harian,
-                        "vehicle_id": vehicle.id,
-                        "nama_kendaraan": vehicle.nama_kendaraan,
-                        "total_waktu": format_waktu(total_time),
-                        "total_jarak_km": round(total_distance, 2),
-                        "locations": current_cluster,
-                    })
-
-                    try:
-                        db.commit()
-                        any_vehicle_used = True
-                        cluster_hari_ini += 1
-                        cluster_id_harian += 1
-                    except Exception as e:
-                        db.rollback()
-                        raise
-
-            if not any_vehicle_used:
-                break
+    for cluster in plan.clusters:
+        hasil_cluster.append({
+            "cluster_id": cluster.cluster_id,
+            "vehicle_id": cluster.vehicle.id,
+            "nama_kendaraan": cluster.vehicle.nama_kendaraan,
+            "total_waktu": format_waktu(cluster.total_time),
+            "total_jarak_km": round(cluster.total_distance, 2),
+            "locations": [
+                {
+                    "id": v.stop.id,
+                    "nama_pengepul": v.stop.nama_pengepul,
+                    "alamat": v.stop.alamat,
+                    "nilai_ekspektasi": float(v.stop.nilai_ekspektasi),
+                    "nilai_ekspektasi_awal": float(v.nilai_awal),
+                    "nilai_diangkut": float(v.nilai_diangkut),
+                    "nilai_ekspektasi_akhir": float(v.nilai_akhir),
+                    "status": v.status,
+                    "latitude": v.stop.lat,
+                    "longitude": v.stop.lon,
+                    "waktu_tempuh": format_waktu(v.travel_time),
+                    "jarak_tempuh_km": round(float(v.distance), 2),
+                }
+                for v in cluster.visits
+            ],
+        })
 
-        for loc in remaining_locations:
-            if loc.nilai_ekspektasi_akhir > 0 and loc.tanggal_cluster <= current_date and loc.status != "Sudah di-cluster":
-                new_date = current_date + timedelta(days=1)
-                while new_date.weekday() == 6:
-                    new_date += timedelta(days=1)
-                loc.tanggal_cluster = new_date
-                db.add(loc)
-        db.commit()
+    return hasil_cluster, []
 
-        next_date = current_date + timedelta(days=1)
-        while next_date.weekday() == 6:
-            next_date += timedelta(days=1)
-        current_date = next_date
+def _loc_id(loc: dict):
+    return loc.get("daily_pengepul_id") or loc.get("id")
 
-    return hasil_cluster, []
+def nearest_neighbor(locations: List[dict], matrix: Optional[RouteMatrix] = None) -> List[dict]:
+    """Find optimized route based on ORS travel time (duration).
 
-@lru_cache(maxsize=1024)
-def cached_ors_request(origin: tuple, dest: tuple) -> float:
-    """Cached ORS request untuk jarak (km)"""
-    _, dist = ors_directions_request(origin, dest)
-    return dist or float("inf")
-
-def build_distance_matrix(locations: List[dict]) -> dict:
-    """Build distance matrix using OSRM cached durations."""
-    matrix = {}
-    depot = (DEPOT_LON, DEPOT_LAT)
-    
-    for loc1 in locations:
-        id1 = str(loc1.get("daily_pengepul_id") or loc1.get("id"))
-        coord1 = (loc1["longitude"], loc1["latitude"])
-        
-        # From depot to loc1
-        dur, _ = ors_directions_request(depot, coord1)
-        matrix[f"DEPOT:{id1}"] = dur
-        
-        # From loc1 to depot
-        dur, _ = ors_directions_request(coord1, depot)
-        matrix[f"{id1}:DEPOT"] = dur
-        
-        for loc2 in locations:
-            if loc1 == loc2:
-                continue
-            id2 = str(loc2.get("daily_pengepul_id") or loc2.get("id"))
-            coord2 = (loc2["longitude"], loc2["latitude"])
-            dur, _ = ors_directions_request(coord1, coord2)
-            matrix[f"{id1}:{id2}"] = dur
-    return matrix
-
-def nearest_neighbor(locations: List[dict]) -> List[dict]:
-    """Find optimized route based on OSRM travel time (duration)."""
+    Tiap langkah hanya membandingkan NN_CANDIDATES lokasi terdekat (garis lurus)
+    lewat matrix, bukan semua lokasi yang tersisa. Kalau tidak ada kandidat yang
+    bisa dirute, sisa lokasi lain ikut dicek; kalau tetap tidak ada, kandidat
+    terdekat tetap diambil supaya tidak ada lokasi yang hilang dari rute.
+    """
     if not locations:
         return []
 
-    distance_matrix = build_distance_matrix(locations)
-    unvisited = locations[:]
+    if matrix is None:
+        matrix = build_route_matrix(locations)
+    coords = [(loc["longitude"], loc["latitude"]) for loc in locations]
+    ids = [_loc_id(loc) for loc in locations]
+    index = SpatialIndex(coords)
     route = []
-    current_id = "DEPOT"
-
-    while unvisited:
-        next_loc = min(
-            unvisited,
-            key=lambda loc: distance_matrix.get(
-                f"{current_id}:{str(loc.get('daily_pengepul_id') or loc.get('id'))}",
-                float("inf")
-            )
-        )
-        route.append(next_loc)
-        current_id = str(next_loc.get("daily_pengepul_id") or next_loc.get("id"))
-        unvisited.remove(next_loc)
+    current, current_id = (DEPOT_LON, DEPOT_LAT), DEPOT_ID
+
+    while index.remaining:
+        candidates = index.nearest(current, NN_CANDIDATES)
+        next_i = min(candidates, key=lambda i: matrix.duration(current_id, ids[i]))
+        if matrix.duration(current_id, ids[next_i]) == float("inf") and index.remaining > len(candidates):
+            # Tidak ada kandidat yang bisa dirute: scan sisa lokasi yang belum dicek
+            checked = set(candidates)
+            rest = [i for i in index.nearest(current, index.remaining) if i not in checked]
+            fallback = min(rest, key=lambda i: matrix.duration(current_id, ids[i]))
+            if matrix.duration(current_id, ids[fallback]) < float("inf"):
+                next_i = fallback
+        route.append(locations[next_i])
+        index.remove(next_i)
+        current, current_id = coords[next_i], ids[next_i]
 
     return route
 
 
+def order_strategy(locations: List[dict]) -> str:
+    """Metode yang dipakai improve_order untuk cluster ini."""
+    if len(locations) < 3:
+        return "tetap"
+    ids = [_loc_id(loc) for loc in locations]
+    if len(locations) <= HELD_KARP_MAX_STOPS and len(set(ids)) == len(ids):
+        return "held-karp"
+    return "2-opt/or-opt"
+
+def improve_order(locations: List[dict], matrix: RouteMatrix, budget: Optional[Budget] = None) -> List[dict]:
+    """Perbaiki urutan hasil nearest_neighbor (jarak km dari matrix).
+
+    Cluster sampai HELD_KARP_MAX_STOPS lokasi diurutkan eksak (Held-Karp),
+    yang lebih besar pakai 2-opt + Or-opt; kurang dari 3 lokasi tidak diubah.
+    """
+    strategy = order_strategy(locations)
+    if strategy == "tetap":
+        return locations
+    ids = [_loc_id(loc) for loc in locations]
+    if strategy == "held-karp":
+        by_id = dict(zip(ids, locations))
+        return [by_id[i] for i in exact_order(ids, matrix.sub_distances(ids))]
+    distances = matrix.sub_distances(ids)
+    order = improve_route(list(range(1, len(locations) + 1)), distances, budget=budget)
+    return [locations[i - 1] for i in order]
+
+def routes_km(ordered_by_cluster: dict, matrix: RouteMatrix) -> float:
+    """Total km depot -> ... -> depot untuk semua cluster (untuk trajectory)."""
+    total = 0.0
+    for locations in ordered_by_cluster.values():
+        if locations:
+            distances = matrix.sub_distances([_loc_id(loc) for loc in locations])
+            total += route_cost(list(range(1, len(locations) + 1)), distances)
+    return round(total, 2)
+
+
 def reset_daily_pengepul(tanggal: date, db: Session):
-    # Hapus semua data Cluster di tanggal itu
+    """Hapus Cluster & reset DailyPengepul di tanggal itu (commit ikut persist hasil sweep)."""
     db.query(Cluster).filter(Cluster.tanggal_cluster == tanggal).delete(synchronize_session=False)
+    db.query(DailyPengepul).filter(DailyPengepul.tanggal_cluster == tanggal).update(
+        {
+            DailyPengepul.nilai_ekspektasi_akhir: DailyPengepul.nilai_ekspektasi_awal,
+            DailyPengepul.status: "Belum di-cluster",
+        },
+        synchronize_session=False,
+    )
 
-    # Reset data daily_pengepul di tanggal itu
-    pengepuls = db.query(DailyPengepul).filter(DailyPengepul.tanggal_cluster == tanggal).all()
-    for loc in pengepuls:
-        loc.nilai_ekspektasi_akhir = loc.nilai_ekspektasi_awal
-        loc.status = "Belum di-cluster"
-        db.add(loc)
+def plan_horizon(tanggal: date, vehicles: List[Vehicle], db: Session, provider: Optional[str] = None, starts: int = 1,
+                 strategy: str = "sweep", rebalance: bool = False, budget: Optional[Budget] = None):
+    """Rencanakan semua hari kerja (maks 5) dari tanggal sekaligus.
+
+    Satu query ambil semua DailyPengepul yang belum terjadwal di horizon (plus
+    cluster_id yang sudah terpakai per hari), planning di memori, lalu satu
+    transaksi simpan seluruh jadwal.
+    """
+    end = add_workdays(tanggal, MAX_EXTRA_WORKDAYS)
+    locations = load_horizon_stops(db, tanggal, end)
+    if not locations:
+        return None
+    used_cluster_ids = load_used_cluster_ids(db, tanggal, end)
+    return sweep_algorithm(
+        locations, vehicles, db,
+        matrix=build_route_matrix(locations, provider, db, tanggal),
+        start_date=tanggal,
+        check_existing=False,
+        starts=starts,
+        strategy=strategy,
+        rebalance=rebalance,
+        budget=budget,
+        used_cluster_ids=used_cluster_ids,
+    )
 
-    db.commit()
+def format_existing_clusters(clusters_existing) -> List[dict]:
+    """Flat data Cluster yang sudah tersimpan (format sama dengan hasil clustering baru)."""
+    flat_data = []
+    for cluster in clusters_existing:
+        loc = cluster.daily_pengepul
+        nilai_diangkut = float(cluster.nilai_diangkut or 0.0)
+        # Hitung waktu unload ulang (jika perlu ditampilkan)
+        waktu_unload = ((nilai_diangkut / 20.0) * 4.26) / 60
+        flat_data.append({
+            "id": loc.id,
+            "nama_pengepul": loc.nama_pengepul,
+            "alamat": loc.alamat,
+            "nilai_ekspektasi": float(loc.nilai_ekspektasi or 0.0),
+            "nilai_ekspektasi_awal": float(loc.nilai_ekspektasi_awal or 0.0),
+            "nilai_ekspektasi_akhir": float(loc.nilai_ekspektasi_akhir or 0.0),
+            "nilai_diangkut": nilai_diangkut,
+            "status": "Sudah di-cluster" if (loc.nilai_ekspektasi_akhir or 0.0) == 0 else "Belum di-cluster",
+            "latitude": float(loc.latitude),
+            "longitude": float(loc.longitude),
+            "cluster_id": cluster.cluster_id,
+            "nama_kendaraan": cluster.vehicle.nama_kendaraan if cluster.vehicle else None,
+            "waktu_unload": format_waktu(waktu_unload),
+            "total_waktu_lokasi": None  # Tidak bisa dihitung akurat dari data lama
+        })
+    return flat_data
+
+def insert_new_stops(tanggal: date, vehicles: List[Vehicle], db: Session, provider: Optional[str] = None):
+    """Sisipkan DailyPengepul baru ke cluster tanggal itu tanpa re-plan (cheapest insertion).
+
+    Return (ringkasan delta: visit baru, urutan lama yang bergeser, cluster berubah;
+    lokasi baru yang belum tertampung & digeser ke hari kerja berikutnya).
+    """
+    clusters, existing = load_day_clusters(db, tanggal)
+    stops = [Stop.from_orm(loc) for loc in load_unclustered_stops(db, tanggal)]
+    known = {v.stop.id: v.stop for c in clusters for v in c.visits}
+    matrix = build_route_matrix([
+        {"id": s.id, "longitude": s.lon, "latitude": s.lat} for s in list(known.values()) + stops
+    ], provider, db, tanggal)
+    legs = LegTable.from_route_matrix(matrix)
+
+    changed = insert_stops(clusters, stops, [Fleet.from_orm(v) for v in vehicles], legs, tanggal, MAX_CLUSTER_PER_DAY)
+    inserted, moved = persist_insertions(db, changed, existing, stops)
+    summary = {"visit_baru": inserted, "urutan_bergeser": moved, "cluster_berubah": len(changed)}
+    return summary, [s for s in stops if s.is_open]
 
 @cluster_router.get("/clustering")
-def sweep_clustering(tanggal: date = Query(...), db: Session = Depends(get_db)):
-    # Cek apakah sudah pernah di-cluster
-    clusters_existing = db.query(Cluster).join(DailyPengepul).filter(
-        DailyPengepul.tanggal_cluster == tanggal
-    ).order_by(Cluster.cluster_id, Cluster.sequence).all()
-
-    existing_ids = set(
-        r[0] for r in db.query(Cluster.daily_pengepul_id)
-        .join(DailyPengepul)
-        .filter(DailyPengepul.tanggal_cluster == tanggal)
-        .all()
-    )
+def sweep_clustering(
+    tanggal: date = Query(...),
+    provider: Optional[str] = Query(default=None, description="Routing provider: ors, osrm, haversine"),
+    starts: int = Query(default=1, ge=1, le=32, description="Jumlah sudut awal sweep; >1 = multi-start paralel (dua arah)"),
+    strategy: str = Query(default="sweep", description="Strategi clustering: sweep, savings (Clarke-Wright)"),
+    rebalance: bool = Query(default=False, description="Relocate/swap/cross-exchange antar cluster di hari yang sama"),
+    time_budget_ms: Optional[int] = Query(default=None, ge=1, le=60000, description="Batas waktu optimasi (ms); strategy=sweep memakai sisa waktu untuk restart (respon menunggu sampai budget habis), strategi lain selesai begitu local search konvergen"),
+    incremental: bool = Query(default=True, description="Data baru disisipkan ke cluster yang ada; False = hapus & cluster ulang"),
+    db: Session = Depends(get_db)
+):
+    try:
+        get_provider(provider)
+    except ValueError as e:
+        return standard_response(message=str(e), status_code=400)
+
+    if strategy not in STRATEGIES:
+        return standard_response(message=f"Unknown strategy '{strategy}'. Pilihan: {', '.join(STRATEGIES)}", status_code=400)
 
-    new_data_available = db.query(DailyPengepul).filter(
-        DailyPengepul.tanggal_cluster == tanggal,
-        ~DailyPengepul.id.in_(existing_ids)
-    ).count() > 0
+    # Cek apakah sudah pernah di-cluster
+    clusters_existing = day_clusters_query(db, tanggal).all()
+    new_data_available = has_unclustered_stops(db, tanggal)
 
     if clusters_existing and not new_data_available:
         # Tampilkan data cluster lama
-        flat_data = []
-        for cluster in clusters_existing:
-            loc = cluster.daily_pengepul
-            nilai_diangkut = float(cluster.nilai_diangkut or 0.0)
-            # Hitung waktu unload ulang (jika perlu ditampilkan)
-            waktu_unload = ((nilai_diangkut / 20.0) * 4.26) / 60
-            flat_data.append({
-                "id": loc.id,
-                "nama_pengepul": loc.nama_pengepul,
-                "alamat": loc.alamat,
-                "nilai_ekspektasi": float(loc.nilai_ekspektasi or 0.0),
-                "nilai_ekspektasi_awal": float(loc.nilai_ekspektasi_awal or 0.0),
-                "nilai_ekspektasi_akhir": float(loc.nilai_ekspektasi_akhir or 0.0),
-                "nilai_diangkut": nilai_diangkut,
-                "status": "Sudah di-cluster" if (loc.nilai_ekspektasi_akhir or 0.0) == 0 else "Belum di-cluster",
-                "latitude": float(loc.latitude),
-                "longitude": float(loc.longitude),
-                "cluster_id": cluster.cluster_id,
-                "nama_kendaraan": cluster.vehicle.nama_kendaraan if cluster.vehicle else None,
-                "waktu_unload": format_waktu(waktu_unload),
-                "total_waktu_lokasi": None  # Tidak bisa dihitung akurat dari data lama
-            })
+        flat_data = format_existing_clusters(clusters_existing)
         return standard_response(
             message=f"{len(flat_data)} data hasil clustering ditemukan.",
             data=flat_data
         )
 
+    vehicles = db.query(Vehicle).order_by(Vehicle.kapasitas_kendaraan.desc()).all()
+
+    # Cluster lama + data baru → sisipkan data baru saja (cluster & route lama tetap)
+    if clusters_existing and new_data_available and incremental and vehicles:
+        insertion, belum_tertampung = insert_new_stops(tanggal, vehicles, db, provider)
+        clusters_existing = day_clusters_query(db, tanggal).populate_existing().all()
+        flat_data = format_existing_clusters(clusters_existing)
+        return standard_response(
+            message=f"{insertion['visit_baru']} kunjungan baru disisipkan, {len(flat_data)} data hasil clustering.",
+            data=flat_data,
+            insertion=insertion,
+            belum_tertampung=[{"id": s.id, "nama_pengepul": s.nama_pengepul, "sisa": s.nilai_ekspektasi_akhir,
+                               "tanggal_cluster": s.tanggal.isoformat()}
+                              for s in belum_tertampung],
+        )
+
     # Kalau ada cluster lama + data baru → reset
     if clusters_existing and new_data_available:
         reset_daily_pengepul(tanggal, db)
 
-    # Mulai proses clustering
-    locations = db.query(DailyPengepul).filter(
-        DailyPengepul.tanggal_cluster == tanggal
-    ).order_by(DailyPengepul.sudut_polar).all()
-
-    vehicles = db.query(Vehicle).order_by(Vehicle.kapasitas_kendaraan.desc()).all()
+    # Mulai proses clustering (seluruh horizon 5 hari kerja sekaligus)
+    budget = Budget(time_budget_ms) if time_budget_ms is not None else None
+    result = plan_horizon(tanggal, vehicles, db, provider, starts, strategy, rebalance, budget) if vehicles else None
 
-    if not locations or not vehicles:
+    if result is None:
         return standard_response(message="Data lokasi atau kendaraan kosong", status_code=400)
 
-    hasil_cluster, _ = sweep_algorithm(locations, vehicles, db)
+    hasil_cluster, _ = result
 
     # Format output (tanpa simpan ulang ke DB)
     flat_data = []
@@ -398,23 +388,36 @@ def sweep_clustering(tanggal: date = Query(...), db: Session = Depends(get_db)):
                 "total_waktu_lokasi": format_waktu(total_waktu_lokasi) if total_waktu_lokasi is not None else None
             })
 
+    extra = {"trajectory": budget.trajectory} if budget is not None else {}
     return standard_response(
         message=f"{len(flat_data)} data berhasil di-cluster!",
-        data=flat_data
+        data=flat_data,
+        **extra
     )
 
 @cluster_router.get("/generate-routes")
 def generate_routes(
     tanggal: date = Query(...),
     optimize: bool = Query(default=True),
+    provider: Optional[str] = Query(default=None, description="Routing provider: ors, osrm, haversine"),
+    time_budget_ms: Optional[int] = Query(default=None, ge=1, le=60000, description="Batas waktu optimasi rute (ms)"),
     db: Session = Depends(get_db)
 ):
     from collections import defaultdict
 
+    budget = Budget(time_budget_ms) if time_budget_ms is not None else None
+
+    try:
+        get_provider(provider)
+    except ValueError as e:
+        return standard_response(message=str(e), status_code=400)
+
     print(f"\n[DEBUG] Param optimize = {optimize}")
     print(f"[DEBUG] Tanggal = {tanggal}")
 
-    clusters = db.query(Cluster).filter(Cluster.tanggal_cluster == tanggal).all()
+    # Satu query untuk cluster + kendaraan + daily pengepul + lokasi tanggal ini
+    route_data = prefetch_route_data(db, tanggal)
+    clusters = route_data.clusters
     if not clusters:
         return standard_response(message="Belum ada cluster untuk tanggal ini", status_code=400)
 
@@ -425,15 +428,24 @@ def generate_routes(
 
     print(f"[DEBUG] Found {len(existing_routes)} existing ClusterRoute (is_optimized={optimize})")
 
-    if existing_routes:
+    # Cluster tanpa ClusterRoute (mis. baru disisipkan incremental) → generate ulang
+    routed_pks = {cr.cluster_id for cr in existing_routes}
+    pks_per_cluster = defaultdict(set)
+    for cl in clusters:
+        pks_per_cluster[cl.cluster_id].add(cl.id)
+    all_routed = all(pks & routed_pks for pks in pks_per_cluster.values())
+
+    if existing_routes and all_routed:
         hasil_routes = []
         cluster_group = defaultdict(list)
         for cr in existing_routes:
             cluster_group[cr.cluster_id].append(cr)
+        vehicle_map = {**route_data.vehicles}
+        vehicle_map.update(vehicles_by_id(db, {cr.vehicle_id for cr in existing_routes} - vehicle_map.keys()))
 
         for cluster_id, routes in cluster_group.items():
             vehicle_id = routes[0].vehicle_id
-            vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+            vehicle = vehicle_map.get(vehicle_id)
 
             route_list = []
             total_nilai = 0.0
@@ -483,21 +495,27 @@ def generate_routes(
 
     cluster_pk_map = {c.cluster_id: c.id for c in clusters}
     cluster_pk_list = list(cluster_pk_map.values())
+    # Delete ikut transaksi insert di akhir, jadi data prefetch tidak ter-expire oleh commit
     db.query(ClusterRoute).filter(ClusterRoute.cluster_id.in_(cluster_pk_list)).delete(synchronize_session=False)
-    db.commit()
     print(f"[DEBUG] Deleted old ClusterRoute for tanggal={tanggal}")
 
     hasil_routes = []
+    route_rows = []
     cluster_dict = defaultdict(list)
     for cl in clusters:
         cluster_dict[cl.cluster_id].append(cl)
 
+    # Satu matrix untuk semua cluster di tanggal ini
+    route_matrix = build_route_matrix([
+        {"daily_pengepul_id": cl.daily_pengepul_id, "longitude": float(cl.longitude), "latitude": float(cl.latitude)}
+        for cl in clusters if cl.latitude is not None and cl.longitude is not None
+    ], provider, db, tanggal)
+
+    # Tahap 1: urutan awal per cluster (konstruksi)
+    ordered_by_cluster = {}
     for cluster_id in sorted(cluster_dict.keys()):
         print(f"\n[DEBUG] Processing cluster_id={cluster_id}")
         cluster_items = cluster_dict[cluster_id]
-        vehicle_id = cluster_items[0].vehicle_id
-        vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
-        cluster_pk = cluster_pk_map[cluster_id]
 
         lokasi_list = []
         for cl in cluster_items:
@@ -518,30 +536,42 @@ def generate_routes(
                 "nilai_diangkut": float(cl.nilai_diangkut)
             })
 
-        dp_map = {
-            dp.id: dp.sudut_polar
-            for dp in db.query(DailyPengepul)
-            .filter(DailyPengepul.id.in_([loc["daily_pengepul_id"] for loc in lokasi_list]))
-            .all()
-        }
-
         for loc in lokasi_list:
-            loc["sudut_polar"] = dp_map.get(loc["daily_pengepul_id"], 0)
+            dp = route_data.daily_pengepul.get(loc["daily_pengepul_id"])
+            loc["sudut_polar"] = dp.sudut_polar if dp is not None else 0
 
         if optimize:
             print("[DEBUG] Sorting with Nearest Neighbor (optimize=True)")
             try:
-                ordered_locations = nearest_neighbor(lokasi_list)
+                ordered_by_cluster[cluster_id] = nearest_neighbor(lokasi_list, route_matrix)
             except Exception as e:
                 print(f"[ERROR] nearest_neighbor error for cluster {cluster_id}: {e}")
                 continue
         else:
             print("[DEBUG] Sorting dengan sudut polar (optimize=False)")
-            ordered_locations = sorted(lokasi_list, key=lambda x: x["sudut_polar"], reverse=True)
+            ordered_by_cluster[cluster_id] = sorted(lokasi_list, key=lambda x: x["sudut_polar"], reverse=True)
+
+    # Tahap 2: Held-Karp (cluster kecil) atau 2-opt/Or-opt per cluster selama waktu masih ada
+    if optimize:
+        if budget is not None:
+            budget.record("nearest_neighbor", total_jarak_km=routes_km(ordered_by_cluster, route_matrix))
+        for cluster_id, ordered_locations in ordered_by_cluster.items():
+            if budget is not None and budget.expired():
+                break
+            ordered_by_cluster[cluster_id] = improve_order(ordered_locations, route_matrix, budget)
+            if budget is not None:
+                budget.record(f"{order_strategy(ordered_locations)} cluster {cluster_id}",
+                              total_jarak_km=routes_km(ordered_by_cluster, route_matrix))
 
+    # Tahap 3: hitung waktu/jarak & simpan ClusterRoute
+    for cluster_id, ordered_locations in ordered_by_cluster.items():
         if not ordered_locations:
             continue
 
+        vehicle_id = cluster_dict[cluster_id][0].vehicle_id
+        vehicle = route_data.vehicles.get(vehicle_id)
+        cluster_pk = cluster_pk_map[cluster_id]
+
         total_waktu_list = []
         total_jarak_list = []
         total_nilai_angkut = 0.0
@@ -549,13 +579,10 @@ def generate_routes(
         route_list = []
 
         for i in range(len(ordered_locations)):
-            asal = {"latitude": DEPOT_LAT, "longitude": DEPOT_LON} if i == 0 else ordered_locations[i - 1]
+            asal_id = DEPOT_ID if i == 0 else ordered_locations[i - 1]["daily_pengepul_id"]
             tujuan = ordered_locations[i]
 
-            dur, dist = ors_directions_request(
-                (asal["longitude"], asal["latitude"]),
-                (tujuan["longitude"], tujuan["latitude"])
-            )
+            dur, dist = route_matrix.leg(asal_id, tujuan["daily_pengepul_id"])
 
             red_light = calculate_red_light_time(dist or 0)
             travel_time = (dist or 0) / SPEED + red_light if dist else 0
@@ -568,10 +595,7 @@ def generate_routes(
             total_jarak_list.append(round(dist or 0, 2))
 
         last_location = ordered_locations[-1]
-        dur_back, dist_back = ors_directions_request(
-            (last_location["longitude"], last_location["latitude"]),
-            (DEPOT_LON, DEPOT_LAT)
-        )
+        dur_back, dist_back = route_matrix.leg(last_location["daily_pengepul_id"], DEPOT_ID)
 
         red_light_back = calculate_red_light_time(dist_back or 0)
         travel_back_time = (dist_back or 0) / SPEED + red_light_back if dist_back else 0
@@ -580,18 +604,18 @@ def generate_routes(
         total_jarak_list.append(round(dist_back or 0, 2))
 
         for idx, loc in enumerate(ordered_locations):
-            daily_pengepul_entry = db.query(DailyPengepul).filter(DailyPengepul.id == loc["daily_pengepul_id"]).first()
+            daily_pengepul_entry = route_data.daily_pengepul.get(loc["daily_pengepul_id"])
             if not daily_pengepul_entry:
                 print(f"[WARNING] DailyPengepul ID={loc['daily_pengepul_id']} not found, skip.")
                 continue
 
-            location_entry = db.query(Location).filter(Location.id == daily_pengepul_entry.location_id).first()
+            location_entry = route_data.locations.get(daily_pengepul_entry.location_id)
             if not location_entry:
                 print(f"[WARNING] Location ID={daily_pengepul_entry.location_id} not found, skip update.")
             else:
                 location_entry.sudah_diambil = True
 
-            db.add(ClusterRoute(
+            route_rows.append(dict(
                 cluster_id=cluster_pk,
                 vehicle_id=vehicle_id,
                 order_no=idx + 1,
@@ -638,10 +662,10 @@ def generate_routes(
         })
 
     try:
-        db.commit()
+        with write_transaction(db):
+            insert_rows(db, ClusterRoute, route_rows)
         print("[DEBUG] DB Commit berhasil")
     except Exception as e:
-        db.rollback()
         print(f"[ERROR] DB Commit error: {e}")
         return standard_response(message=f"DB Commit Error: {e}", status_code=500)
 
@@ -651,7 +675,8 @@ def generate_routes(
             "tanggal": tanggal.isoformat(),
             "is_optimized": optimize,
             "total_cluster": len(hasil_routes),
-            "hasil_routes": hasil_routes
+            "hasil_routes": hasil_routes,
+            **({"trajectory": budget.trajectory} if budget is not None else {})
         }
     )
 
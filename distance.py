@@ -2,10 +2,13 @@
 
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
-from models import DailyPengepul, TimeDistanceMatrix
+from models import DailyPengepul
 from database import get_db
-from utils.routing import ors_directions_request
-import json
+from algorithms.clustering import DEPOT_COORD
+from services.matrix_store import matrix_to_rows, save_time_distance_matrix
+from utils.day_matrix import DayMatrix
+from utils.providers import get_provider
+from utils.route_matrix import DEPOT_ID
 from datetime import date
 
 distance_router = APIRouter(prefix="/distance_matrix", tags=["Distance Matrix"])
@@ -13,6 +16,7 @@ distance_router = APIRouter(prefix="/distance_matrix", tags=["Distance Matrix"])
 @distance_router.get("/generate", summary="Generate & save adjusted ORS matrix")
 def generate_matrix(
     tanggal: date = Query(..., description="Tanggal cluster yang ingin digunakan"),
+    compress: bool = Query(default=False, description="Simpan matrix dengan kompresi zlib"),
     db: Session = Depends(get_db)
 ):
     pengepul_today = db.query(DailyPengepul).filter(DailyPengepul.tanggal_cluster == tanggal).all()
@@ -23,28 +27,26 @@ def generate_matrix(
     if any(p.latitude is None or p.longitude is None for p in pengepul_today):
         raise HTTPException(status_code=400, detail="Some DailyPengepul entries have no coordinates")
 
+    # Blob tersimpan: index 0 = depot, sisanya daily_pengepul sesuai urutan ids
     daily_pengepul_ids = [p.id for p in pengepul_today]
-    coords = [(p.longitude, p.latitude) for p in pengepul_today]
+    ids = [DEPOT_ID] + daily_pengepul_ids
+    coords = [DEPOT_COORD] + [(p.longitude, p.latitude) for p in pengepul_today]
 
     try:
-        durations, distances = ors_directions_request(coords)
+        matrix = DayMatrix.build(coords, get_provider())
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error while fetching adjusted matrix data: {e}")
 
-    matrix_entry = TimeDistanceMatrix(
-        location_ids=json.dumps(daily_pengepul_ids),
-        time_matrix=json.dumps(durations),
-        distance_matrix=json.dumps(distances)
-    )
-
-    db.add(matrix_entry)
-    db.commit()
+    # DayMatrix menggabungkan titik kembar; satu baris per id lagi (jarak antar titik kembar = 0)
+    durations, distances = matrix.to_arrays(coords)
+    save_time_distance_matrix(db, tanggal, ids, durations, distances, compress, points=coords)
 
+    # Response tetap sejajar daily_pengepul_ids seperti sebelumnya, depot cuma di blob
     return {
         "message": f"Matrix saved successfully with adjusted values for {tanggal}",
         "data": {
             "daily_pengepul_ids": daily_pengepul_ids,
-            "time_matrix": durations,
-            "distance_matrix": distances
+            "time_matrix": matrix_to_rows(durations[1:, 1:]),
+            "distance_matrix": matrix_to_rows(distances[1:, 1:])
         }
     }
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
 from database import get_db
 from models import Cluster, ClusterRoute, DailyPengepul, Location
@@ -6,6 +6,7 @@ from schemas import LocationCreate, LocationResponse
 from auth import get_current_user
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
+from services.cache_warmer import warm_location
 
 location_router = APIRouter()
 
@@ -27,6 +28,7 @@ def add_status_diambil(location: Location):
 
 @location_router.post("/")
 def create_location(
+    background_tasks: BackgroundTasks,
     location: LocationCreate = Depends(LocationCreate.as_form),
     db: Session = Depends(get_db),
     user=Depends(get_current_user)
@@ -46,6 +48,9 @@ def create_location(
         db.commit()
         db.refresh(new_location)
 
+        # Hitung leg ORS lokasi baru di background supaya clustering berikutnya sudah warm
+        background_tasks.add_task(warm_location, new_location.id)
+
         return standard_response(
             data=add_status_diambil(new_location),
             message="Lokasi berhasil ditambahkan"
@@ -97,6 +102,7 @@ def get_location(location_id: int, db: Session = Depends(get_db), user=Depends(g
 @location_router.put("/{location_id}")
 def update_location(
     location_id: int,
+    background_tasks: BackgroundTasks,
     updated_location: LocationCreate = Depends(LocationCreate.as_form),
     db: Session = Depends(get_db),
     user=Depends(get_current_user)
@@ -118,6 +124,8 @@ def update_location(
         db.commit()
         db.refresh(location)
 
+        background_tasks.add_task(warm_location, location.id)
+
         return standard_response(
             data=add_status_diambil(location),
             message="Lokasi berhasil diperbarui"
@@ -8,7 +8,9 @@ from vehicle import vehicle_router
 from clustering import cluster_router
 from distance import distance_router
 from daily_pengepul import router as daily_pengepul_router
+from routing_admin import routing_router
 from database import Base, engine
+from services.cache_warmer import start_nightly_warmer
 
 import os
 
@@ -35,6 +37,11 @@ app.add_middleware(
 # DB setup
 Base.metadata.create_all(bind=engine)
 
+# Warming cache routing tiap malam
+@app.on_event("startup")
+def start_background_jobs():
+    start_nightly_warmer()
+
 # Middleware cek token
 @app.middleware("http")
 async def check_token_middleware(request: Request, call_next):
@@ -81,6 +88,7 @@ api_v1_router.include_router(vehicle_router, prefix="/vehicles", tags=["Vehicles
 api_v1_router.include_router(cluster_router, prefix="/clusters", tags=["Clustering"])
 api_v1_router.include_router(distance_router, prefix="/distance_matrix", tags=["Distance Matrix"])
 api_v1_router.include_router(daily_pengepul_router, prefix="/pengepul", tags=["Daily Pengepul"])
+api_v1_router.include_router(routing_router, prefix="/routing", tags=["Routing"])
 
 app.include_router(api_v1_router)
 
@@ -0,0 +1,17 @@
+-- time_distance_matrix: kolom teks JSON -> biner utils/matrix_codec, plus kunci lookup per tanggal.
+-- Base.metadata.create_all tidak mengubah tabel yang sudah ada, jadi jalankan sekali di database lama:
+--   mysql -u <user> -p <db> < migrations/001_time_distance_matrix_binary.sql
+--
+-- Baris lama (format JSON) tetap ada dengan tanggal_cluster NULL; lookup per tanggal tidak
+-- pernah memilihnya, matrix baru dibuat lewat /distance_matrix/generate.
+
+ALTER TABLE time_distance_matrix
+    ADD COLUMN tanggal_cluster DATE NULL AFTER id,
+    ADD COLUMN location_key VARCHAR(40) NULL AFTER tanggal_cluster,
+    MODIFY COLUMN location_ids LONGBLOB NULL,
+    ADD COLUMN location_coords LONGBLOB NULL AFTER location_ids,
+    MODIFY COLUMN time_matrix LONGBLOB NULL,
+    MODIFY COLUMN distance_matrix LONGBLOB NULL;
+
+CREATE INDEX ix_time_distance_matrix_tanggal_cluster ON time_distance_matrix (tanggal_cluster);
+CREATE INDEX ix_time_distance_matrix_location_key ON time_distance_matrix (location_key);
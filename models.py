@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from sqlalchemy import JSON, Boolean, Column, DateTime, Integer, String, Date, Enum, Float, ForeignKey, Text, Numeric
+from sqlalchemy import JSON, Boolean, Column, DateTime, Integer, LargeBinary, String, Date, Enum, Float, ForeignKey, Text, Numeric
 from sqlalchemy.orm import relationship
 from database import Base
 from geopy.distance import geodesic
@@ -175,7 +175,14 @@ class TimeDistanceMatrix(Base):
     __tablename__ = "time_distance_matrix"
 
     id = Column(Integer, primary_key=True, index=True)
-    location_ids = Column(Text)
-    time_matrix = Column(Text)
-    distance_matrix = Column(Text)
+    tanggal_cluster = Column(Date, index=True, nullable=True)
+    # sha1 dari daily_pengepul id (urut), untuk lookup per set lokasi
+    location_key = Column(String(40), index=True, nullable=True)
+
+    # Format biner utils/matrix_codec (float32/int32 + header), LONGBLOB di MySQL
+    location_ids = Column(LargeBinary(length=2**32 - 1))
+    # (lon, lat) per id saat matrix dibuat; matrix diabaikan kalau lokasi sudah pindah
+    location_coords = Column(LargeBinary(length=2**32 - 1), nullable=True)
+    time_matrix = Column(LargeBinary(length=2**32 - 1))
+    distance_matrix = Column(LargeBinary(length=2**32 - 1))
 
@@ -4,6 +4,7 @@ from database import get_db
 from utils.standard_response import standard_response
 from algorithms.clustering import sweep_algorithm, nearest_neighbor_route
 from models import Cluster, ClusterRoute, DailyPengepul, Vehicle
+from services.persistence import insert_rows, write_transaction
 from datetime import date
 
 router = APIRouter()
@@ -51,29 +52,32 @@ def clustering_hybrid(tanggal: date = Query(...), db: Session = Depends(get_db))
 
 # SAVE CLUSTERS FUNCTION (REVISED)
 def save_clusters(db: Session, clusters: list[dict]):
-    for cluster in clusters:
-        if not cluster["locations"]:
-            continue
-        new_cluster = Cluster(
-            cluster_id=cluster["cluster_id"],
-            daily_pengepul_id=cluster["locations"][0]["id"],  # <-- ambil dari locations
-            vehicle_id=cluster["vehicle_id"]
-        )
-        db.add(new_cluster)
-    db.commit()
+    rows = [
+        {
+            "cluster_id": cluster["cluster_id"],
+            "daily_pengepul_id": cluster["locations"][0]["id"],  # <-- ambil dari locations
+            "vehicle_id": cluster["vehicle_id"],
+        }
+        for cluster in clusters
+        if cluster["locations"]
+    ]
+    with write_transaction(db):
+        insert_rows(db, Cluster, rows)
 
 def save_routes(db: Session, routes: list[dict]):
-    for route in routes:
-        for loc in route["locations"]:
-            new_route = ClusterRoute(
-                cluster_id=route["cluster_id"],
-                vehicle_id=route["vehicle_id"],
-                order_no=loc["order_no"],
-                daily_pengepul_id=loc["daily_pengepul_id"],  # <--- fix disini
-                nama_pengepul=loc["nama_pengepul"],
-                alamat=loc["alamat"],
-                waktu_tempuh=loc["waktu_tempuh"],
-                jarak_tempuh_km=loc["jarak_tempuh_km"]
-            )
-            db.add(new_route)
-    db.commit()
+    rows = [
+        {
+            "cluster_id": route["cluster_id"],
+            "vehicle_id": route["vehicle_id"],
+            "order_no": loc["order_no"],
+            "daily_pengepul_id": loc["daily_pengepul_id"],  # <--- fix disini
+            "nama_pengepul": loc["nama_pengepul"],
+            "alamat": loc["alamat"],
+            "waktu_tempuh": loc["waktu_tempuh"],
+            "jarak_tempuh_km": loc["jarak_tempuh_km"],
+        }
+        for route in routes
+        for loc in route["locations"]
+    ]
+    with write_transaction(db):
+        insert_rows(db, ClusterRoute, rows)
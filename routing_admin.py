@@ -0,0 +1,57 @@
+from typing import Optional
+
+from fastapi import APIRouter, BackgroundTasks, Query
+
+from services.cache_warmer import warm_locations
+from utils.routing import list_failed_pairs, purge_failed_pairs, routing_stats
+from utils.standard_response import standard_response
+
+routing_router = APIRouter()
+
+
+@routing_router.get("/cache/stats")
+def get_cache_stats():
+    """Hit/miss per tier (L1 per worker, L2 shared SQLite) dan jumlah call ke ORS."""
+    return standard_response(
+        message="Berhasil mengambil statistik cache routing",
+        data=routing_stats()
+    )
+
+
+@routing_router.get("/cache/failures")
+def get_failed_pairs(limit: int = Query(default=500, ge=1, le=5000)):
+    """Pasangan koordinat yang gagal di-route ORS (negative cache) beserta alasannya."""
+    data = list_failed_pairs(limit)
+    return standard_response(
+        message=f"{len(data)} pasangan gagal di-route ditemukan",
+        data=data
+    )
+
+
+@routing_router.delete("/cache/failures")
+def delete_failed_pairs(
+    origin_lon: Optional[float] = Query(None),
+    origin_lat: Optional[float] = Query(None),
+    dest_lon: Optional[float] = Query(None),
+    dest_lat: Optional[float] = Query(None),
+):
+    """Hapus negative cache (semua, atau satu pasangan) supaya dicoba ulang ke ORS."""
+    coords = (origin_lon, origin_lat, dest_lon, dest_lat)
+    if any(c is not None for c in coords) and not all(c is not None for c in coords):
+        return standard_response(message="Isi semua koordinat origin & destination, atau kosongkan semua", status_code=400)
+
+    if all(c is not None for c in coords):
+        purged = purge_failed_pairs((origin_lon, origin_lat), (dest_lon, dest_lat))
+    else:
+        purged = purge_failed_pairs()
+    return standard_response(
+        message=f"{purged} pasangan gagal dihapus dari cache",
+        data={"purged": purged}
+    )
+
+
+@routing_router.post("/cache/warm")
+def trigger_cache_warm(background_tasks: BackgroundTasks):
+    """Jalankan warming depot <-> lokasi dan lokasi <-> lokasi di background."""
+    background_tasks.add_task(warm_locations)
+    return standard_response(message="Warming cache routing dijalankan di background")
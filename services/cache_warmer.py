@@ -0,0 +1,82 @@
+"""Background warming of the routing cache for depot <-> Location and Location <-> Location legs.
+
+Runs after a Location is created/updated (only that location's row and column)
+and nightly for everything, so daily clustering reads from a warm cache.
+"""
+import fcntl
+import logging
+import os
+import pathlib
+import threading
+import time
+from datetime import datetime, timedelta
+
+from algorithms.clustering import DEPOT_COORD
+from database import SessionLocal
+from models import Location
+from utils.routing import warm_missing_legs
+
+logger = logging.getLogger("routing")
+
+CACHE_WARM_HOUR = int(os.getenv("CACHE_WARM_HOUR", "1"))  # jam lokal untuk warming malam
+CACHE_WARM_LOCK = pathlib.Path(os.getenv("CACHE_WARM_LOCK", "/tmp/ud_sregep_cache_warm.lock"))
+
+
+def warm_locations(location_ids: list[int] | None = None) -> dict:
+    """Fill missing legs between depot and all locations.
+
+    With location_ids, those locations are placed first so only their legs to and
+    from everything else need new Matrix requests.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(Location.id, Location.longitude, Location.latitude).all()
+    finally:
+        db.close()
+
+    targets = set(location_ids or [])
+    ordered = sorted(rows, key=lambda r: r.id not in targets)
+    points = [DEPOT_COORD] + [(float(r.longitude), float(r.latitude)) for r in ordered]
+
+    started = time.time()
+    result = warm_missing_legs(points)
+    result["seconds"] = round(time.time() - started, 2)
+    logger.info(f"Cache warm (locations={location_ids or 'all'}): {result}")
+    return result
+
+
+def warm_location(location_id: int):
+    """BackgroundTasks entry point after a Location create/update."""
+    try:
+        warm_locations([location_id])
+    except Exception as e:
+        logger.warning(f"Cache warm for location {location_id} failed: {e}")
+
+
+def _seconds_until(hour: int) -> float:
+    now = datetime.now()
+    run_at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if run_at <= now:
+        run_at += timedelta(days=1)
+    return (run_at - now).total_seconds()
+
+
+def _nightly_loop():
+    while True:
+        time.sleep(_seconds_until(CACHE_WARM_HOUR))
+        # Satu worker saja yang jalan kalau uvicorn pakai banyak worker
+        with open(CACHE_WARM_LOCK, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue
+            try:
+                warm_locations()
+            except Exception as e:
+                logger.warning(f"Nightly cache warm failed: {e}")
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def start_nightly_warmer():
+    threading.Thread(target=_nightly_loop, name="cache-warmer", daemon=True).start()
@@ -1,30 +1,259 @@
-from models import Cluster, ClusterRoute
+from dataclasses import dataclass
+
+from sqlalchemy import exists, func
+from sqlalchemy.orm import joinedload
+
+from algorithms.sweep import SERVED, Fleet, PlannedCluster, Stop, Visit
+from models import Cluster, ClusterRoute, DailyPengepul, Vehicle
+from services.persistence import insert_clusters, insert_rows, update_rows, write_transaction
 
 def save_clusters(db, clusters: list[dict]):
-    for cluster in clusters:
-        for loc in cluster["locations"]:
-            db.add(
-                Cluster(
-                    cluster_id=cluster["cluster_id"],
-                    daily_pengepul_id=loc["id"],
-                    vehicle_id=cluster["vehicle_id"]
-                )
-            )
-    db.commit()
+    rows = [
+        {"cluster_id": cluster["cluster_id"], "daily_pengepul_id": loc["id"], "vehicle_id": cluster["vehicle_id"]}
+        for cluster in clusters
+        for loc in cluster["locations"]
+    ]
+    with write_transaction(db):
+        insert_rows(db, Cluster, rows)
 
 def save_routes(db, routes: list[dict]):
-    for cluster_route in routes:
-        for loc in cluster_route["locations"]:
-            db.add(
-                ClusterRoute(
-                    cluster_id=cluster_route["cluster_id"],
-                    vehicle_id=cluster_route["vehicle_id"],
-                    order_no=loc["order_no"],
-                    daily_pengepul_id=loc["daily_pengepul_id"],
-                    nama_pengepul=loc["nama_pengepul"],
-                    alamat=loc["alamat"],
-                    waktu_tempuh=loc["waktu_tempuh"],
-                    jarak_tempuh_km=loc["jarak_tempuh_km"],
-                )
+    rows = [
+        {
+            "cluster_id": cluster_route["cluster_id"],
+            "vehicle_id": cluster_route["vehicle_id"],
+            "order_no": loc["order_no"],
+            "daily_pengepul_id": loc["daily_pengepul_id"],
+            "nama_pengepul": loc["nama_pengepul"],
+            "alamat": loc["alamat"],
+            "waktu_tempuh": loc["waktu_tempuh"],
+            "jarak_tempuh_km": loc["jarak_tempuh_km"],
+        }
+        for cluster_route in routes
+        for loc in cluster_route["locations"]
+    ]
+    with write_transaction(db):
+        insert_rows(db, ClusterRoute, rows)
+
+def load_horizon_stops(db, start, end):
+    """Semua DailyPengepul di [start, end] yang belum punya Cluster sejak start, dalam satu query."""
+    scheduled = exists().where(
+        Cluster.daily_pengepul_id == DailyPengepul.id,
+        Cluster.tanggal_cluster >= start,
+    )
+    return db.query(DailyPengepul).filter(
+        DailyPengepul.tanggal_cluster.between(start, end),
+        ~scheduled,
+    ).order_by(DailyPengepul.sudut_polar).populate_existing().all()
+
+
+def load_used_cluster_ids(db, start, end):
+    """cluster_id tertinggi yang sudah tersimpan per tanggal di [start, end] (satu query GROUP BY)."""
+    return dict(
+        db.query(Cluster.tanggal_cluster, func.max(Cluster.cluster_id))
+        .filter(Cluster.tanggal_cluster.between(start, end))
+        .group_by(Cluster.tanggal_cluster)
+        .all()
+    )
+
+
+def persist_sweep_plan(db, plan, check_existing: bool = True):
+    """Simpan hasil plan_sweep dalam satu transaksi: update DailyPengepul + insert Cluster.
+
+    check_existing=False kalau stop-nya sudah dipastikan belum punya Cluster
+    (mis. dari load_horizon_stops), jadi tidak perlu query tambahan.
+    """
+    existing = set()
+    if plan.clusters and check_existing:
+        stop_ids = {v.stop.id for c in plan.clusters for v in c.visits}
+        dates = {c.tanggal for c in plan.clusters}
+        existing = set(
+            db.query(Cluster.daily_pengepul_id, Cluster.tanggal_cluster, Cluster.cluster_id)
+            .filter(Cluster.daily_pengepul_id.in_(stop_ids), Cluster.tanggal_cluster.in_(dates))
+            .all()
+        )
+
+    cluster_rows = []
+    for cluster in plan.clusters:
+        for idx, visit in enumerate(cluster.visits):
+            if (visit.stop.id, cluster.tanggal, cluster.cluster_id) in existing:
+                continue
+            cluster_rows.append({
+                "cluster_id": cluster.cluster_id,
+                "daily_pengepul_id": visit.stop.id,
+                "vehicle_id": cluster.vehicle.id,
+                "nama_pengepul": visit.stop.nama_pengepul,
+                "alamat": visit.stop.alamat,
+                "nilai_ekspektasi": visit.stop.nilai_ekspektasi,
+                "nilai_ekspektasi_awal": visit.nilai_awal,
+                "nilai_ekspektasi_akhir": visit.nilai_akhir,
+                "latitude": visit.stop.lat,
+                "longitude": visit.stop.lon,
+                "nilai_diangkut": visit.nilai_diangkut,
+                "tanggal_cluster": cluster.tanggal,
+                "sequence": idx,
+            })
+
+    stop_rows = [
+        {
+            "id": s.id,
+            "nilai_ekspektasi_awal": s.nilai_ekspektasi_awal,
+            "nilai_ekspektasi_akhir": s.nilai_ekspektasi_akhir,
+            "tanggal_cluster": s.tanggal,
+            "status": s.status,
+        }
+        for s in plan.dirty_stops
+    ]
+
+    with write_transaction(db):
+        update_rows(db, DailyPengepul, stop_rows)
+        insert_clusters(db, cluster_rows)
+
+
+def day_clusters_query(db, tanggal):
+    """Cluster milik tanggal itu (menurut Cluster.tanggal_cluster), urut cluster & sequence."""
+    return (
+        db.query(Cluster)
+        .options(joinedload(Cluster.daily_pengepul), joinedload(Cluster.vehicle))
+        .filter(Cluster.tanggal_cluster == tanggal)
+        .order_by(Cluster.cluster_id, Cluster.sequence)
+    )
+
+
+def load_day_clusters(db, tanggal):
+    """Cluster yang sudah ada di tanggal itu sebagai PlannedCluster + map (cluster_id, daily_pengepul_id) -> row."""
+    rows = day_clusters_query(db, tanggal).all()
+    clusters = {}
+    stops = {}
+    for row in rows:
+        if row.daily_pengepul is None or row.vehicle is None:
+            continue
+        cluster = clusters.get(row.cluster_id)
+        if cluster is None:
+            cluster = clusters[row.cluster_id] = PlannedCluster(
+                cluster_id=row.cluster_id, tanggal=tanggal, vehicle=Fleet.from_orm(row.vehicle)
             )
-    db.commit()
+        stop = stops.get(row.daily_pengepul_id)
+        if stop is None:
+            stop = stops[row.daily_pengepul_id] = Stop.from_orm(row.daily_pengepul)
+        cluster.visits.append(Visit(
+            stop, float(row.nilai_ekspektasi_awal or 0.0), float(row.nilai_diangkut or 0.0),
+            float(row.nilai_ekspektasi_akhir or 0.0), stop.status, 0.0, 0.0,
+        ))
+    existing = {(row.cluster_id, row.daily_pengepul_id): row for row in rows}
+    return list(clusters.values()), existing
+
+
+def _unclustered_query(db, tanggal):
+    # Sama dengan load_horizon_stops: Cluster di hari sebelumnya (split pickup) tidak dihitung
+    scheduled = exists().where(
+        Cluster.daily_pengepul_id == DailyPengepul.id,
+        Cluster.tanggal_cluster >= tanggal,
+    )
+    return db.query(DailyPengepul).filter(
+        DailyPengepul.tanggal_cluster == tanggal,
+        DailyPengepul.status != SERVED,
+        ~scheduled,
+    )
+
+
+def load_unclustered_stops(db, tanggal):
+    """DailyPengepul di tanggal itu yang belum terjadwal di Cluster tanggal itu atau sesudahnya."""
+    return _unclustered_query(db, tanggal).all()
+
+
+def has_unclustered_stops(db, tanggal) -> bool:
+    return db.query(_unclustered_query(db, tanggal).exists()).scalar()
+
+
+def persist_insertions(db, clusters, existing, stops):
+    """Simpan hanya delta cheapest insertion dalam satu transaksi.
+
+    Visit baru jadi Cluster baru, Cluster lama yang bergeser cuma di-update
+    sequence-nya. ClusterRoute cluster yang berubah dihapus supaya
+    generate_routes membuatnya ulang; cluster lain tidak disentuh.
+    """
+    new_rows, sequence_rows = [], []
+    for cluster in clusters:
+        for idx, visit in enumerate(cluster.visits):
+            row = existing.get((cluster.cluster_id, visit.stop.id))
+            if row is not None:
+                if row.sequence != idx:
+                    sequence_rows.append({"id": row.id, "sequence": idx})
+                continue
+            new_rows.append({
+                "cluster_id": cluster.cluster_id,
+                "daily_pengepul_id": visit.stop.id,
+                "vehicle_id": cluster.vehicle.id,
+                "nama_pengepul": visit.stop.nama_pengepul,
+                "alamat": visit.stop.alamat,
+                "nilai_ekspektasi": visit.stop.nilai_ekspektasi,
+                "nilai_ekspektasi_awal": visit.nilai_awal,
+                "nilai_ekspektasi_akhir": visit.nilai_akhir,
+                "latitude": visit.stop.lat,
+                "longitude": visit.stop.lon,
+                "nilai_diangkut": visit.nilai_diangkut,
+                "tanggal_cluster": cluster.tanggal,
+                "sequence": idx,
+            })
+
+    stop_rows = [
+        {
+            "id": s.id,
+            "nilai_ekspektasi_awal": s.nilai_ekspektasi_awal,
+            "nilai_ekspektasi_akhir": s.nilai_ekspektasi_akhir,
+            "tanggal_cluster": s.tanggal,
+            "status": s.status,
+        }
+        for s in stops if s.dirty
+    ]
+
+    touched_ids = {c.cluster_id for c in clusters}
+    stale_pks = [row.id for (cluster_id, _), row in existing.items() if cluster_id in touched_ids]
+
+    with write_transaction(db):
+        update_rows(db, DailyPengepul, stop_rows)
+        update_rows(db, Cluster, sequence_rows)
+        insert_clusters(db, new_rows)
+        if stale_pks:
+            db.query(ClusterRoute).filter(ClusterRoute.cluster_id.in_(stale_pks)).delete(synchronize_session=False)
+    return len(new_rows), len(sequence_rows)
+
+
+@dataclass
+class RouteData:
+    """Semua yang dibutuhkan generate_routes untuk satu tanggal, di-key per id."""
+    clusters: list
+    vehicles: dict
+    daily_pengepul: dict
+    locations: dict
+
+
+def prefetch_route_data(db, tanggal) -> RouteData:
+    """Cluster + Vehicle + DailyPengepul + Location tanggal itu dalam satu query (joined load)."""
+    clusters = (
+        db.query(Cluster)
+        .options(
+            joinedload(Cluster.vehicle),
+            joinedload(Cluster.daily_pengepul).joinedload(DailyPengepul.location),
+        )
+        .filter(Cluster.tanggal_cluster == tanggal)
+        .all()
+    )
+    vehicles, daily, locations = {}, {}, {}
+    for cl in clusters:
+        if cl.vehicle is not None:
+            vehicles[cl.vehicle.id] = cl.vehicle
+        dp = cl.daily_pengepul
+        if dp is not None:
+            daily[dp.id] = dp
+            if dp.location is not None:
+                locations[dp.location.id] = dp.location
+    return RouteData(clusters, vehicles, daily, locations)
+
+
+def vehicles_by_id(db, ids) -> dict:
+    """Vehicle untuk banyak id dalam satu query."""
+    ids = set(ids)
+    if not ids:
+        return {}
+    return {v.id: v for v in db.query(Vehicle).filter(Vehicle.id.in_(ids)).all()}
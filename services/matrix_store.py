@@ -0,0 +1,99 @@
+"""Persist and look up day matrices in TimeDistanceMatrix (binary columns)."""
+import logging
+from datetime import date
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, load_only
+
+from models import TimeDistanceMatrix
+from utils.matrix_codec import decode_ids, decode_matrix, encode_ids, encode_matrix, ids_key
+
+
+COORD_TOLERANCE = 1e-5  # derajat (~1 m); koordinat disimpan float32
+
+logger = logging.getLogger("routing")
+
+
+def save_time_distance_matrix(db: Session, tanggal: date, ids: list[int], durations, distances,
+                              compress: bool = False, points=None) -> TimeDistanceMatrix:
+    """Store hours/km matrices for ids (depot first, id 0) and their (lon, lat) points."""
+    entry = TimeDistanceMatrix(
+        tanggal_cluster=tanggal,
+        location_key=ids_key(ids),
+        location_ids=encode_ids(ids),
+        location_coords=encode_matrix(np.asarray(points, dtype=float)) if points is not None else None,
+        time_matrix=encode_matrix(durations, compress),
+        distance_matrix=encode_matrix(distances, compress),
+    )
+    db.add(entry)
+    db.commit()
+    return entry
+
+
+def _coords_match(entry, ids: list[int], points) -> bool:
+    """Koordinat tersimpan sama dengan sekarang (matrix lama tanpa koordinat dianggap basi)."""
+    if entry.location_coords is None:
+        return False
+    stored = dict(zip(decode_ids(entry.location_ids), decode_matrix(entry.location_coords)))
+    for loc_id, point in zip(ids, points):
+        coord = stored.get(loc_id)
+        if coord is None or np.abs(coord - np.asarray(point, dtype=float)).max() > COORD_TOLERANCE:
+            return False
+    return True
+
+
+def find_time_distance_matrix(db: Session, tanggal: date, ids: list[int], points):
+    """Return (stored_ids, time ndarray, distance ndarray) covering ids on tanggal, or None.
+
+    Exact id sets hit the location_key index; otherwise the newest matrix of the
+    date whose ids are a superset is used (e.g. one cluster out of the whole day).
+    A matrix only counts if its stored coordinates still match points, so a moved
+    location never gets stale legs.
+
+    A table that is not migrated yet (migrations/001_time_distance_matrix_binary.sql)
+    counts as a miss, so callers rebuild the matrix instead of failing.
+    """
+    try:
+        # Savepoint: yang gagal cuma lookup ini, perubahan caller di transaksi yang sama tetap ada
+        with db.begin_nested():
+            return _find_time_distance_matrix(db, tanggal, ids, points)
+    except SQLAlchemyError as e:
+        logger.warning(f"Stored matrix lookup failed, rebuilding instead: {getattr(e, 'orig', e)}")
+        return None
+
+
+def _find_time_distance_matrix(db: Session, tanggal: date, ids: list[int], points):
+    wanted = set(ids)
+    entry = (
+        db.query(TimeDistanceMatrix)
+        .filter(TimeDistanceMatrix.tanggal_cluster == tanggal, TimeDistanceMatrix.location_key == ids_key(ids))
+        .order_by(TimeDistanceMatrix.id.desc())
+        .first()
+    )
+    if entry is not None and not _coords_match(entry, ids, points):
+        entry = None
+    if entry is None:
+        # Scan cuma baca ids & koordinat; blob matrix diambil untuk entry yang cocok saja
+        for candidate in (
+            db.query(TimeDistanceMatrix)
+            .options(load_only(TimeDistanceMatrix.id, TimeDistanceMatrix.location_ids, TimeDistanceMatrix.location_coords))
+            .filter(TimeDistanceMatrix.tanggal_cluster == tanggal)
+            .order_by(TimeDistanceMatrix.id.desc())
+        ):
+            if wanted.issubset(decode_ids(candidate.location_ids)) and _coords_match(candidate, ids, points):
+                entry = candidate
+                break
+    if entry is None:
+        return None
+    time_blob, distance_blob = (
+        db.query(TimeDistanceMatrix.time_matrix, TimeDistanceMatrix.distance_matrix)
+        .filter(TimeDistanceMatrix.id == entry.id)
+        .one()
+    )
+    return decode_ids(entry.location_ids), decode_matrix(time_blob), decode_matrix(distance_blob)
+
+
+def matrix_to_rows(array: np.ndarray) -> list[list]:
+    """ndarray (NaN = unroutable) -> nested lists with None, e.g. for JSON responses."""
+    return [[None if np.isnan(v) else float(v) for v in row] for row in array]
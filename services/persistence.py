@@ -0,0 +1,43 @@
+"""Shared write path for planning results (Cluster, ClusterRoute, DailyPengepul).
+
+Rows are plain dicts sent with SQLAlchemy Core statements as executemany, so a
+whole plan costs one round trip per table instead of one INSERT per ORM object.
+Nothing here commits; wrap the calls in write_transaction.
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from models import Cluster
+
+
+@contextmanager
+def write_transaction(db: Session):
+    """Commit sekali di akhir; rollback semua kalau ada yang gagal."""
+    try:
+        yield db
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def insert_rows(db: Session, model, rows: list[dict]) -> int:
+    """Multi-row INSERT (executemany) of rows into model's table."""
+    if not rows:
+        return 0
+    db.execute(insert(model), rows)
+    return len(rows)
+
+
+def update_rows(db: Session, model, rows: list[dict]) -> int:
+    """UPDATE by primary key for many rows at once; every dict must contain the "id"."""
+    if not rows:
+        return 0
+    db.execute(update(model), rows)
+    return len(rows)
+
+
+def insert_clusters(db: Session, rows: list[dict]) -> int:
+    return insert_rows(db, Cluster, rows)
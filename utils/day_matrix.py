@@ -0,0 +1,99 @@
+"""Day-level duration/distance matrix shared by the sweep and the route builder."""
+import math
+
+import numpy as np
+
+from utils.providers import RoutingProvider, get_provider
+
+
+def _coord_key(coord) -> str:
+    return f"{float(coord[0]):.6f},{float(coord[1]):.6f}"
+
+
+class DayMatrix:
+    """In-memory duration/distance matrix for the depot plus one planning day's stops.
+
+    Built once per planning run so the sweep and route builder read legs from
+    memory instead of issuing one Directions call per pair.
+    """
+
+    def __init__(self, points: list[tuple[float, float]], provider: RoutingProvider | None = None):
+        self.provider = provider or get_provider()
+        self.points: list[tuple[float, float]] = []
+        self.index: dict[str, int] = {}
+        for p in points:
+            k = _coord_key(p)
+            if k not in self.index:
+                self.index[k] = len(self.points)
+                self.points.append((float(p[0]), float(p[1])))
+        n = len(self.points)
+        self.durations: list[list] = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+        self.distances: list[list] = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+        self.complete = False
+
+    @classmethod
+    def build(cls, points: list[tuple[float, float]], provider: RoutingProvider | None = None) -> "DayMatrix":
+        matrix = cls(points, provider)
+        if len(matrix.points) > 1:
+            matrix.durations, matrix.distances = matrix.provider.matrix(matrix.points)
+            matrix.fill_missing()
+        return matrix
+
+    @classmethod
+    def from_arrays(cls, points: list[tuple[float, float]], durations, distances,
+                    provider: RoutingProvider | None = None) -> "DayMatrix":
+        """Wrap a stored matrix (ndarray, NaN = unroutable) whose rows follow points."""
+        matrix = cls(points, provider)
+        if len(matrix.points) != len(points):
+            raise ValueError("Stored matrix points must be unique")
+        matrix.durations = [[None if math.isnan(v) else v for v in row] for row in durations.tolist()]
+        matrix.distances = [[None if math.isnan(v) else v for v in row] for row in distances.tolist()]
+        return matrix
+
+    def fill_missing(self):
+        """Fetch every still-empty cell in one concurrent batch."""
+        n = len(self.points)
+        cells = [(i, j) for i in range(n) for j in range(n) if i != j and self.durations[i][j] is None]
+        self.complete = True
+        if not cells:
+            return
+        results = self.provider.directions_many([(self.points[i], self.points[j]) for i, j in cells])
+        for (i, j), (dur, dist) in zip(cells, results):
+            if dur is not None:
+                self.durations[i][j], self.distances[i][j] = dur, dist
+
+    def to_arrays(self, points: list[tuple[float, float]]):
+        """Return (durations, distances) as float ndarrays (NaN = unroutable) following points."""
+        rows = [self.index.get(_coord_key(p)) for p in points]
+        if None in rows:
+            n = len(points)
+            durations, distances = np.zeros((n, n)), np.zeros((n, n))
+            for i, a in enumerate(points):
+                for j, b in enumerate(points):
+                    if i != j:
+                        dur, dist = self.lookup(a, b)
+                        durations[i, j] = np.nan if dur is None else dur
+                        distances[i, j] = np.nan if dist is None else dist
+            return durations, distances
+        if not self.complete:
+            self.fill_missing()
+        ix = np.ix_(rows, rows)
+        durations = np.array(self.durations, dtype=float)  # None -> nan
+        distances = np.array(self.distances, dtype=float)
+        return durations[ix], distances[ix]
+
+    def lookup(self, origin: tuple[float, float], destination: tuple[float, float]):
+        """Return (duration_h, distance_km); legs outside the matrix fall back to the provider."""
+        i = self.index.get(_coord_key(origin))
+        j = self.index.get(_coord_key(destination))
+        if i is None or j is None:
+            return self.provider.directions(
+                (float(origin[0]), float(origin[1])),
+                (float(destination[0]), float(destination[1])),
+            )
+        if self.durations[i][j] is None:
+            dur, dist = self.provider.directions(self.points[i], self.points[j])
+            if dur is None:
+                return None, None
+            self.durations[i][j], self.distances[i][j] = dur, dist
+        return self.durations[i][j], self.distances[i][j]
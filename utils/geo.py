@@ -0,0 +1,38 @@
+"""Great-circle helpers and the offline road estimate used when no router is available."""
+import math
+import os
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Faktor detour jalan vs garis lurus, dikalibrasi dari cache ORS area Sleman/Jogja
+DETOUR_FACTOR = float(os.getenv("ROUTING_DETOUR_FACTOR", "1.35"))
+AVG_SPEED_KMH = float(os.getenv("ROUTING_AVG_SPEED_KMH", "40"))
+
+
+def haversine_km(origin: tuple[float, float], destination: tuple[float, float]) -> float:
+    """Great-circle distance between two (lon, lat) points."""
+    lon1, lat1 = math.radians(float(origin[0])), math.radians(float(origin[1]))
+    lon2, lat2 = math.radians(float(destination[0])), math.radians(float(destination[1]))
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def estimate_leg(origin, destination, detour_factor: float = DETOUR_FACTOR, speed_kmh: float = AVG_SPEED_KMH):
+    """Return an estimated (duration_h, distance_km) for one leg."""
+    dist = haversine_km(origin, destination) * detour_factor
+    return round(dist / speed_kmh, 2), round(dist, 2)
+
+
+def haversine_matrix(origins, destinations=None):
+    """Vectorized great-circle distances (km) between every origin and destination (lon, lat)."""
+    a = np.radians(np.asarray(origins, dtype=float).reshape(-1, 2))
+    b = a if destinations is None else np.radians(np.asarray(destinations, dtype=float).reshape(-1, 2))
+    dlon = b[None, :, 0] - a[:, None, 0]
+    dlat = b[None, :, 1] - a[:, None, 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(a[:, None, 1]) * np.cos(b[None, :, 1]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
@@ -0,0 +1,74 @@
+"""Binary format for TimeDistanceMatrix columns.
+
+Layout (little endian): 4-byte magic b"TDM1", uint8 flags, uint8 dtype code,
+uint16 reserved, uint32 rows, uint32 cols, then rows*cols values. float32 for
+matrices (NaN = unroutable), int32 for id lists (cols = 1). Flag bit 0 means
+the payload after the header is zlib-compressed.
+"""
+import hashlib
+import json
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"TDM1"
+HEADER = struct.Struct("<4sBBHII")
+FLAG_ZLIB = 0x01
+_DTYPES = {1: np.dtype("<f4"), 2: np.dtype("<i4")}
+_DTYPE_CODES = {v: k for k, v in _DTYPES.items()}
+
+
+def _encode(array: np.ndarray, compress: bool) -> bytes:
+    payload = array.tobytes()
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= FLAG_ZLIB
+    rows, cols = array.shape
+    return HEADER.pack(MAGIC, flags, _DTYPE_CODES[array.dtype], 0, rows, cols) + payload
+
+
+def _decode(blob: bytes) -> np.ndarray:
+    magic, flags, dtype_code, _, rows, cols = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Not a TDM1 blob")
+    dtype = _DTYPES[dtype_code]
+    if flags & FLAG_ZLIB:
+        return np.frombuffer(zlib.decompress(memoryview(blob)[HEADER.size:]), dtype=dtype).reshape(rows, cols)
+    # Tanpa kompresi: view langsung ke bytes baris DB, tanpa copy
+    return np.frombuffer(blob, dtype=dtype, count=rows * cols, offset=HEADER.size).reshape(rows, cols)
+
+
+def encode_matrix(matrix, compress: bool = False) -> bytes:
+    """Encode an n x n matrix (lists with None, or ndarray) as float32."""
+    array = np.array(
+        [[np.nan if v is None else v for v in row] for row in matrix] if isinstance(matrix, list) else matrix,
+        dtype="<f4",
+    )
+    if array.ndim != 2:
+        array = array.reshape(len(array), -1)
+    return _encode(np.ascontiguousarray(array), compress)
+
+
+def decode_matrix(blob) -> np.ndarray:
+    """Return the stored matrix as a read-only float32 ndarray (legacy JSON text also accepted)."""
+    if isinstance(blob, str) or not bytes(blob[:4]) == MAGIC:
+        legacy = json.loads(blob)
+        return np.array([[np.nan if v is None else v for v in row] for row in legacy], dtype="<f4")
+    return _decode(bytes(blob) if isinstance(blob, memoryview) else blob)
+
+
+def encode_ids(ids: list[int]) -> bytes:
+    return _encode(np.asarray(ids, dtype="<i4").reshape(-1, 1), compress=False)
+
+
+def decode_ids(blob) -> list[int]:
+    if isinstance(blob, str) or not bytes(blob[:4]) == MAGIC:
+        return [int(i) for i in json.loads(blob)]
+    return _decode(blob).ravel().tolist()
+
+
+def ids_key(ids) -> str:
+    """Order-independent key of an id set, for indexed lookup."""
+    return hashlib.sha1(",".join(str(i) for i in sorted(set(ids))).encode()).hexdigest()
@@ -0,0 +1,101 @@
+"""Async ORS Directions client with a persistent connection pool.
+
+The httpx.AsyncClient lives on one background event loop thread for the whole
+process, so keep-alive connections survive across requests. Sync code (FastAPI
+`def` endpoints, the sweep) calls it through run_sync().
+"""
+import asyncio
+import logging
+import os
+import threading
+
+import httpx
+
+from utils.resilience import ORSRouteError, ORSUnavailableError, call_with_retry_async, route_error
+
+logger = logging.getLogger("routing")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+ORS_BASE_URL = "https://api.openrouteservice.org"
+ORS_MAX_CONCURRENCY = int(os.getenv("ORS_MAX_CONCURRENCY", "8"))
+
+
+class AsyncORSClient:
+    def __init__(self, api_key: str, max_concurrency: int = ORS_MAX_CONCURRENCY, timeout: float = 10):
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=ORS_BASE_URL,
+                headers={"Authorization": self.api_key, "Content-Type": "application/json"},
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                timeout=self.timeout,
+            )
+        return self._client
+
+    async def directions(self, origin, destination, profile="driving-car"):
+        """Return (duration_h, distance_km) for one leg.
+
+        Raises ORSRouteError for an unroutable leg and ORSUnavailableError when ORS itself is failing.
+        """
+        body = {
+            "coordinates": [
+                [float(origin[0]), float(origin[1])],
+                [float(destination[0]), float(destination[1])],
+            ],
+            "units": "km",
+        }
+        r = await call_with_retry_async(lambda: self._get_client().post(f"/v2/directions/{profile}", json=body))
+        try:
+            r.raise_for_status()
+            summary = r.json()["routes"][0]["summary"]
+            return round(summary["duration"] / 3600, 2), round(summary["distance"], 2)
+        except Exception as exc:
+            logger.error(f"ORS Directions error: {exc} {r.text[:300]}")
+            raise route_error(r) from exc
+
+    async def directions_many(self, pairs, profile="driving-car"):
+        """Fetch all (origin, destination) pairs concurrently, at most max_concurrency in flight.
+
+        Failed pairs come back as ORSRouteError / ORSUnavailableError instances.
+        """
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _one(origin, destination):
+            async with semaphore:
+                try:
+                    return await self.directions(origin, destination, profile)
+                except (ORSRouteError, ORSUnavailableError) as exc:
+                    return exc
+
+        return await asyncio.gather(*(_one(o, d) for o, d in pairs))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="ors-client-loop", daemon=True).start()
+        return _loop
+
+
+def run_sync(coro):
+    """Run a coroutine on the client loop from sync code and wait for the result."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
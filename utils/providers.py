@@ -0,0 +1,170 @@
+"""Routing providers: ORS (default), OSRM-compatible HTTP, and an offline estimator.
+
+Pick one per deployment with ROUTING_PROVIDER=ors|osrm|haversine, or per request
+by passing the provider name to get_provider(). Without ROUTING_PROVIDER the
+default is ORS when ORS_API_KEY is set, otherwise the offline estimator. All providers return legs as
+(duration_h, distance_km) and matrices as n x n lists, with None for unroutable
+cells.
+"""
+import logging
+import os
+
+import requests
+
+from utils.geo import AVG_SPEED_KMH, DETOUR_FACTOR, estimate_leg
+from utils.routing import (
+    ORS_API_KEY, directions_many, get_cached_pairs, missing_blocks, ors_directions_request, ors_matrix_request,
+)
+
+logger = logging.getLogger("routing")
+
+DEFAULT_PROVIDER = os.getenv("ROUTING_PROVIDER") or ("ors" if ORS_API_KEY else "haversine")
+OSRM_URL = os.getenv("OSRM_URL", "http://localhost:5000")
+
+
+class RoutingProvider:
+    name = "base"
+
+    def directions(self, origin: tuple[float, float], destination: tuple[float, float]):
+        raise NotImplementedError
+
+    def directions_many(self, pairs):
+        return [self.directions(o, d) for o, d in pairs]
+
+    def matrix(self, points: list[tuple[float, float]]):
+        n = len(points)
+        durations = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+        distances = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+        for i in range(n):
+            for j in range(n):
+                if i != j:
+                    durations[i][j], distances[i][j] = self.directions(points[i], points[j])
+        return durations, distances
+
+
+class ORSProvider(RoutingProvider):
+    """openrouteservice via the shared pair cache; cache misses go to one tiled Matrix fetch."""
+
+    name = "ors"
+
+    def __init__(self, profile: str = "driving-car"):
+        self.profile = profile
+
+    def directions(self, origin, destination):
+        return ors_directions_request(origin, destination, self.profile)
+
+    def directions_many(self, pairs):
+        return directions_many(pairs, self.profile)
+
+    def matrix(self, points):
+        n = len(points)
+        durations = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+        distances = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+        cells = [(i, j) for i in range(n) for j in range(n) if i != j]
+        missing = []
+        for (i, j), cached in zip(cells, get_cached_pairs([(points[i], points[j]) for i, j in cells])):
+            if cached is None:
+                missing.append((i, j))
+                continue
+            durations[i][j], distances[i][j] = cached
+
+        if missing:
+            # Hanya tile yang berisi leg kosong yang diminta ke ORS
+            blocks = missing_blocks(missing)
+            logger.info(f"ORS matrix: {len(missing)} legs missing from cache, fetching {len(blocks)} tile(s)")
+            durs, dists = ors_matrix_request(points, self.profile, blocks)
+            for i in range(n):
+                for j in range(n):
+                    if durations[i][j] is None and durs[i][j] is not None:
+                        durations[i][j] = durs[i][j]
+                        distances[i][j] = dists[i][j]
+        return durations, distances
+
+
+class OSRMProvider(RoutingProvider):
+    """Any OSRM-compatible HTTP server (/route and /table services)."""
+
+    name = "osrm"
+
+    def __init__(self, base_url: str = OSRM_URL, profile: str = "driving"):
+        self.base_url = base_url.rstrip("/")
+        self.profile = profile
+
+    @staticmethod
+    def _coords(points) -> str:
+        return ";".join(f"{float(lon):.6f},{float(lat):.6f}" for lon, lat in points)
+
+    def directions(self, origin, destination):
+        try:
+            r = requests.get(
+                f"{self.base_url}/route/v1/{self.profile}/{self._coords([origin, destination])}",
+                params={"overview": "false"},
+                timeout=10,
+            )
+            r.raise_for_status()
+            route = r.json()["routes"][0]
+            return round(route["duration"] / 3600, 2), round(route["distance"] / 1000, 2)
+        except Exception as exc:
+            logger.error(f"OSRM route error: {exc}")
+            return None, None
+
+    def matrix(self, points):
+        n = len(points)
+        try:
+            r = requests.get(
+                f"{self.base_url}/table/v1/{self.profile}/{self._coords(points)}",
+                params={"annotations": "duration,distance"},
+                timeout=30,
+            )
+            r.raise_for_status()
+            data = r.json()
+        except Exception as exc:
+            logger.error(f"OSRM table error: {exc}")
+            return super().matrix(points)
+
+        durations = [[None] * n for _ in range(n)]
+        distances = [[None] * n for _ in range(n)]
+        for i in range(n):
+            for j in range(n):
+                dur = data["durations"][i][j]
+                dist = data["distances"][i][j]
+                if dur is not None and dist is not None:
+                    durations[i][j] = round(dur / 3600, 2)
+                    distances[i][j] = round(dist / 1000, 2)
+        return durations, distances
+
+
+class HaversineProvider(RoutingProvider):
+    """Offline estimate: great-circle distance x detour factor at a fixed average speed.
+
+    Deterministic and network-free, for planning when ORS is unavailable and for
+    benchmarks/tests.
+    """
+
+    name = "haversine"
+
+    def __init__(self, detour_factor: float = DETOUR_FACTOR, speed_kmh: float = AVG_SPEED_KMH):
+        self.detour_factor = detour_factor
+        self.speed_kmh = speed_kmh
+
+    def directions(self, origin, destination):
+        return estimate_leg(origin, destination, self.detour_factor, self.speed_kmh)
+
+
+PROVIDERS = {
+    ORSProvider.name: ORSProvider,
+    OSRMProvider.name: OSRMProvider,
+    HaversineProvider.name: HaversineProvider,
+}
+
+_INSTANCES: dict[str, RoutingProvider] = {}
+
+
+def get_provider(name: str | None = None) -> RoutingProvider:
+    """Return the provider for name (default: ROUTING_PROVIDER env)."""
+    key = (name or DEFAULT_PROVIDER).lower()
+    if key not in PROVIDERS:
+        raise ValueError(f"Unknown routing provider '{key}'. Pilihan: {', '.join(PROVIDERS)}")
+    if key not in _INSTANCES:
+        _INSTANCES[key] = PROVIDERS[key]()
+    return _INSTANCES[key]
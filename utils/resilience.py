@@ -0,0 +1,234 @@
+"""Rate limiting, retries and a circuit breaker for ORS calls.
+
+One token bucket and one breaker are shared by the sync (requests) and async
+(httpx) paths of the process. When retries are exhausted or the breaker is
+open, callers get ORSUnavailableError and fall back to the offline estimate
+instead of dropping the stop.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+
+logger = logging.getLogger("routing")
+
+ORS_RATE_PER_MIN = float(os.getenv("ORS_RATE_PER_MIN", "40"))
+ORS_RATE_BURST = int(os.getenv("ORS_RATE_BURST", "10"))
+ORS_MAX_RETRIES = int(os.getenv("ORS_MAX_RETRIES", "3"))
+ORS_BACKOFF_BASE = float(os.getenv("ORS_BACKOFF_BASE", "0.5"))
+ORS_BACKOFF_CAP = float(os.getenv("ORS_BACKOFF_CAP", "8"))
+ORS_BREAKER_THRESHOLD = int(os.getenv("ORS_BREAKER_THRESHOLD", "5"))
+ORS_BREAKER_RESET = float(os.getenv("ORS_BREAKER_RESET", "60"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ORSUnavailableError(Exception):
+    """ORS is rate limiting, erroring or unreachable (not: this pair is unroutable)."""
+
+
+class ORSRouteError(Exception):
+    """ORS answered, but cannot route this pair (bad coordinates, unreachable point)."""
+
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+def route_error(response) -> Exception:
+    """Map a final non-2xx/empty ORS response to the exception to raise.
+
+    Only answers about the pair itself become ORSRouteError (and may be
+    negatively cached). Everything else - bad or expired key (401/403), payload
+    too large (413), unexpected bodies - is ORSUnavailableError, so the caller
+    falls back to the offline estimate instead of marking the pair unroutable.
+    """
+    detail = response.text[:300]
+    code = None
+    try:
+        code = response.json().get("error", {}).get("code")
+    except Exception:
+        pass
+    # 2009: route not found, 2010: point not found / not routable, 2004: distance limit
+    if response.status_code == 404 or code in (2009, 2010):
+        return ORSRouteError("unroutable", detail)
+    if code == 2004:
+        return ORSRouteError("too_far", detail)
+    if response.status_code == 400:
+        return ORSRouteError("bad_request", detail)
+    return ORSUnavailableError(f"HTTP {response.status_code}: {detail}")
+
+
+class TokenBucket:
+    """Token bucket shared across threads; callers reserve a token and sleep until it is due."""
+
+    def __init__(self, rate_per_min: float = ORS_RATE_PER_MIN, burst: int = ORS_RATE_BURST):
+        self.rate = rate_per_min / 60.0
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take one token (possibly going into debt) and return how long to wait for it."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"rate_per_min": self.rate * 60, "burst": self.burst, "tokens": round(self.tokens, 2)}
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half_open after reset timeout -> one probe."""
+
+    def __init__(self, failure_threshold: int = ORS_BREAKER_THRESHOLD, reset_timeout: float = ORS_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("ORS circuit breaker closed")
+            self.state = "closed"
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                    logger.warning(f"ORS circuit breaker open for {self.reset_timeout}s")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+            }
+
+
+ORS_RATE_LIMITER = TokenBucket()
+ORS_BREAKER = CircuitBreaker()
+RETRY_STATS = {"retries": 0, "unavailable": 0}
+
+
+def backoff_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Full-jitter exponential backoff; honours a numeric Retry-After header."""
+    if retry_after:
+        try:
+            return min(float(retry_after), ORS_BACKOFF_CAP)
+        except ValueError:
+            pass
+    return random.uniform(0, min(ORS_BACKOFF_CAP, ORS_BACKOFF_BASE * 2 ** attempt))
+
+
+def _classify(response):
+    """Return None if the response is final, otherwise a description of the retryable failure."""
+    if response.status_code in RETRY_STATUSES:
+        return f"HTTP {response.status_code}"
+    return None
+
+
+def call_with_retry(send):
+    """Run send() -> response under rate limit, retries and breaker (sync path)."""
+    last_error = None
+    for attempt in range(ORS_MAX_RETRIES + 1):
+        if not ORS_BREAKER.allow():
+            break
+        ORS_RATE_LIMITER.acquire()
+        retry_after = None
+        try:
+            response = send()
+        except (requests.RequestException, httpx.HTTPError) as exc:
+            last_error = repr(exc)
+        else:
+            last_error = _classify(response)
+            if last_error is None:
+                ORS_BREAKER.record_success()
+                return response
+            retry_after = response.headers.get("Retry-After")
+        ORS_BREAKER.record_failure()
+        if attempt < ORS_MAX_RETRIES:
+            RETRY_STATS["retries"] += 1
+            time.sleep(backoff_delay(attempt, retry_after))
+    RETRY_STATS["unavailable"] += 1
+    raise ORSUnavailableError(last_error or "circuit breaker open")
+
+
+async def call_with_retry_async(send):
+    """Async twin of call_with_retry; send() returns an awaitable response."""
+    last_error = None
+    for attempt in range(ORS_MAX_RETRIES + 1):
+        if not ORS_BREAKER.allow():
+            break
+        await ORS_RATE_LIMITER.acquire_async()
+        retry_after = None
+        try:
+            response = await send()
+        except httpx.HTTPError as exc:
+            last_error = repr(exc)
+        else:
+            last_error = _classify(response)
+            if last_error is None:
+                ORS_BREAKER.record_success()
+                return response
+            retry_after = response.headers.get("Retry-After")
+        ORS_BREAKER.record_failure()
+        if attempt < ORS_MAX_RETRIES:
+            RETRY_STATS["retries"] += 1
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
+    RETRY_STATS["unavailable"] += 1
+    raise ORSUnavailableError(last_error or "circuit breaker open")
+
+
+def resilience_stats() -> dict:
+    return {
+        "circuit_breaker": ORS_BREAKER.snapshot(),
+        "rate_limiter": ORS_RATE_LIMITER.snapshot(),
+        **RETRY_STATS,
+    }
@@ -0,0 +1,286 @@
+"""ORS pair cache: in-process LRU (L1) in front of a shared SQLite WAL file (L2).
+
+L2 replaces the old whole-file ors_cache.json: lookups are point queries on the
+primary key, writes are batched in one transaction, entries expire by their
+`ts` after a TTL and the table is trimmed oldest-first past a size bound.
+Pairs ORS could not route are stored too, with a reason code and a much
+shorter TTL, so a bad location costs one upstream attempt per TTL window.
+Every uvicorn worker opens the same file, so a pair fetched by one worker is
+visible to the others on their next L1 miss. L1 is small and per process.
+"""
+import json
+import logging
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("routing")
+
+CACHE_DB = pathlib.Path(os.getenv("ROUTE_CACHE_PATH", str(pathlib.Path(__file__).with_name("ors_cache.sqlite3"))))
+LEGACY_CACHE_FILE = pathlib.Path(__file__).with_name("ors_cache.json")
+CACHE_TTL_SECONDS = float(os.getenv("ROUTE_CACHE_TTL_DAYS", "30")) * 86400
+CACHE_MAX_ENTRIES = int(os.getenv("ROUTE_CACHE_MAX_ENTRIES", "500000"))
+CACHE_L1_SIZE = int(os.getenv("ROUTE_CACHE_L1_SIZE", "5000"))
+NEGATIVE_TTL_SECONDS = float(os.getenv("ROUTE_CACHE_NEGATIVE_TTL_HOURS", "24")) * 3600
+
+_SQLITE_MAX_VARS = 900
+_EVICT_CHECK_EVERY = 1000
+
+
+class L1Cache:
+    """Thread-safe bounded LRU of key -> (duration_h, distance_km, ts, reason).
+
+    reason is None for routed pairs; failures carry their reason code and
+    expire against the negative TTL.
+    """
+
+    def __init__(self, maxsize: int = CACHE_L1_SIZE):
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, min_ts: float, min_negative_ts: float):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[2] < (min_ts if entry[3] is None else min_negative_ts):
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: tuple):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = entry
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, keys):
+        with self._lock:
+            for k in keys:
+                self._data.pop(k, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RouteCache:
+    def __init__(self, path: pathlib.Path = CACHE_DB, ttl_seconds: float = CACHE_TTL_SECONDS,
+                 max_entries: int = CACHE_MAX_ENTRIES, l1_size: int = CACHE_L1_SIZE,
+                 negative_ttl_seconds: float = NEGATIVE_TTL_SECONDS):
+        self.path = pathlib.Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self.l1 = L1Cache(l1_size)
+        self.counters = {
+            "l1_hits": 0, "l1_misses": 0, "l2_hits": 0, "l2_misses": 0,
+            "negative_hits": 0, "writes": 0, "negative_writes": 0,
+        }
+        self._counters_lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_evict = 0
+        self._init_schema()
+
+    def _conn(self) -> sqlite3.Connection:
+        # Satu koneksi per thread per proses (jangan dipakai lintas fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _init_schema(self):
+        conn = self._conn()
+        conn.execute("CREATE TABLE IF NOT EXISTS pairs (k TEXT PRIMARY KEY, d REAL, s REAL, ts REAL NOT NULL)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_ts ON pairs(ts)")
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (k TEXT PRIMARY KEY, v TEXT)")
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(pairs)")}
+        for column in ("reason", "detail"):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE pairs ADD COLUMN {column} TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_pairs_reason ON pairs(reason) WHERE reason IS NOT NULL")
+        self._import_legacy_json()
+
+    def _count(self, **deltas):
+        with self._counters_lock:
+            for name, delta in deltas.items():
+                self.counters[name] += delta
+
+    def _min_ts(self) -> float:
+        return time.time() - self.ttl_seconds
+
+    def _min_negative_ts(self) -> float:
+        return time.time() - self.negative_ttl_seconds
+
+    def get(self, key: str):
+        """Return (duration_h, distance_km), (None, None) for a cached failure, or None if unknown."""
+        return self.get_many([key]).get(key)
+
+    def get_many(self, keys: list[str]) -> dict[str, tuple]:
+        found = {}
+        min_ts, min_negative_ts = self._min_ts(), self._min_negative_ts()
+        unique = list(dict.fromkeys(keys))
+        l2_keys = []
+        negative_hits = 0
+        for k in unique:
+            entry = self.l1.get(k, min_ts, min_negative_ts)
+            if entry is None:
+                l2_keys.append(k)
+            else:
+                found[k] = (entry[0], entry[1])
+                negative_hits += entry[3] is not None
+        self._count(l1_hits=len(unique) - len(l2_keys), l1_misses=len(l2_keys))
+
+        conn = self._conn()
+        for start in range(0, len(l2_keys), _SQLITE_MAX_VARS):
+            chunk = l2_keys[start:start + _SQLITE_MAX_VARS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT k, d, s, ts, reason FROM pairs WHERE k IN ({placeholders}) AND ts >= ?",
+                (*chunk, min(min_ts, min_negative_ts)),
+            ).fetchall()
+            hits = 0
+            for k, d, s, ts, reason in rows:
+                if ts < (min_ts if reason is None else min_negative_ts):
+                    continue
+                found[k] = (d, s)
+                self.l1.put(k, (d, s, ts, reason))
+                hits += 1
+                negative_hits += reason is not None
+            self._count(l2_hits=hits, l2_misses=len(chunk) - hits)
+        self._count(negative_hits=negative_hits)
+        return found
+
+    def put(self, key: str, duration_h: float, distance_km: float):
+        self.put_many([(key, duration_h, distance_km)])
+
+    def put_many(self, entries: list[tuple[str, float, float]]):
+        """Write (key, duration_h, distance_km) entries in one transaction."""
+        if not entries:
+            return
+        now = time.time()
+        for k, d, s in entries:
+            self.l1.put(k, (d, s, now, None))
+        self._count(writes=len(entries))
+        if self._write("INSERT OR REPLACE INTO pairs (k, d, s, ts, reason, detail) VALUES (?, ?, ?, ?, NULL, NULL)",
+                       [(k, d, s, now) for k, d, s in entries]):
+            self._maybe_evict(len(entries))
+
+    def put_failures(self, entries: list[tuple[str, str, str]]):
+        """Cache (key, reason, detail) for pairs ORS could not route."""
+        if not entries:
+            return
+        now = time.time()
+        for k, reason, _ in entries:
+            self.l1.put(k, (None, None, now, reason))
+        self._count(negative_writes=len(entries))
+        if self._write("INSERT OR REPLACE INTO pairs (k, d, s, ts, reason, detail) VALUES (?, NULL, NULL, ?, ?, ?)",
+                       [(k, now, reason, (detail or "")[:500]) for k, reason, detail in entries]):
+            self._maybe_evict(len(entries))
+
+    def list_failures(self, limit: int = 500) -> list[dict]:
+        rows = self._conn().execute(
+            "SELECT k, reason, detail, ts FROM pairs WHERE reason IS NOT NULL AND ts >= ? ORDER BY ts DESC LIMIT ?",
+            (self._min_negative_ts(), limit),
+        ).fetchall()
+        return [
+            {
+                "key": k,
+                "origin": k.split(":")[0],
+                "destination": k.split(":")[1],
+                "reason": reason,
+                "detail": detail,
+                "cached_at": ts,
+                "expires_at": ts + self.negative_ttl_seconds,
+            }
+            for k, reason, detail, ts in rows
+        ]
+
+    def purge_failures(self, key: str | None = None) -> int:
+        """Delete cached failures (all, or one pair key) so they are retried on next lookup.
+
+        Only this worker's L1 is cleared; other workers keep their in-memory copy
+        until it expires against the negative TTL.
+        """
+        conn = self._conn()
+        if key is None:
+            keys = [r[0] for r in conn.execute("SELECT k FROM pairs WHERE reason IS NOT NULL")]
+        else:
+            keys = [r[0] for r in conn.execute("SELECT k FROM pairs WHERE reason IS NOT NULL AND k = ?", (key,))]
+        self.l1.discard(keys)
+        for start in range(0, len(keys), _SQLITE_MAX_VARS):
+            chunk = keys[start:start + _SQLITE_MAX_VARS]
+            conn.execute(f"DELETE FROM pairs WHERE k IN ({','.join('?' * len(chunk))})", chunk)
+        return len(keys)
+
+    def _write(self, sql: str, rows: list[tuple]) -> bool:
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(sql, rows)
+            conn.execute("COMMIT")
+            return True
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            logger.warning(f"Failed to save cache: {e}")
+            return False
+
+    def _maybe_evict(self, written: int):
+        self._writes_since_evict += written
+        if self._writes_since_evict >= _EVICT_CHECK_EVERY:
+            self._writes_since_evict = 0
+            self.evict()
+
+    def stats(self) -> dict:
+        """Per-tier hit/miss counters for this process plus current sizes."""
+        conn = self._conn()
+        l2_entries = conn.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+        l2_failures = conn.execute("SELECT COUNT(*) FROM pairs WHERE reason IS NOT NULL").fetchone()[0]
+        with self._counters_lock:
+            counters = dict(self.counters)
+        return {**counters, "l1_entries": len(self.l1), "l2_entries": l2_entries, "l2_failures": l2_failures}
+
+    def evict(self):
+        """Drop expired rows, then the oldest rows beyond max_entries."""
+        conn = self._conn()
+        conn.execute("DELETE FROM pairs WHERE reason IS NULL AND ts < ?", (self._min_ts(),))
+        conn.execute("DELETE FROM pairs WHERE reason IS NOT NULL AND ts < ?", (self._min_negative_ts(),))
+        count = conn.execute("SELECT COUNT(*) FROM pairs").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute(
+                "DELETE FROM pairs WHERE k IN (SELECT k FROM pairs ORDER BY ts ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def _import_legacy_json(self):
+        """One-time import of the old ors_cache.json, keeping its `ts` values."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE k = 'legacy_json_imported'").fetchone():
+            return
+        entries = {}
+        if LEGACY_CACHE_FILE.exists() and LEGACY_CACHE_FILE.stat().st_size > 0:
+            try:
+                entries = json.loads(LEGACY_CACHE_FILE.read_text())
+            except Exception as e:
+                logger.warning(f"Failed to load legacy cache: {e}")
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT OR IGNORE INTO pairs (k, d, s, ts) VALUES (?, ?, ?, ?)",
+            [(k, v["d"], v["s"], v.get("ts", time.time())) for k, v in entries.items()],
+        )
+        conn.execute("INSERT OR REPLACE INTO meta (k, v) VALUES ('legacy_json_imported', ?)", (str(time.time()),))
+        conn.execute("COMMIT")
+        if entries:
+            logger.info(f"Imported {len(entries)} entries from {LEGACY_CACHE_FILE.name}")
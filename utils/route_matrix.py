@@ -0,0 +1,63 @@
+"""Dense per-day route matrix addressed by id instead of formatted string keys."""
+import numpy as np
+
+from utils.day_matrix import DayMatrix
+
+DEPOT_ID = 0
+
+
+class RouteMatrix:
+    """Contiguous duration (h) / distance (km) arrays for one planning day.
+
+    Row/column k belongs to ids[k]; index maps id -> k and DEPOT_ID (0) is the
+    depot. NaN marks an unroutable leg. Plain arrays + a dict, so it pickles
+    cheaply to worker processes.
+    """
+
+    __slots__ = ("ids", "index", "points", "durations", "distances")
+
+    def __init__(self, ids, points, durations, distances):
+        self.ids = list(ids)
+        self.index = {i: k for k, i in enumerate(self.ids)}
+        self.points = [(float(p[0]), float(p[1])) for p in points]
+        self.durations = np.ascontiguousarray(durations, dtype=float)
+        self.distances = np.ascontiguousarray(distances, dtype=float)
+
+    @classmethod
+    def from_day_matrix(cls, matrix: DayMatrix, ids, points) -> "RouteMatrix":
+        durations, distances = matrix.to_arrays(points)
+        return cls(ids, points, durations, distances)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __contains__(self, id_) -> bool:
+        return id_ in self.index
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def rows(self, ids) -> np.ndarray:
+        return np.fromiter((self.index[i] for i in ids), dtype=int)
+
+    def leg(self, origin_id, destination_id):
+        """Return (duration_h, distance_km), or (None, None) when the leg is unroutable."""
+        i, j = self.index[origin_id], self.index[destination_id]
+        dur, dist = self.durations[i, j], self.distances[i, j]
+        if np.isnan(dur) or np.isnan(dist):
+            return None, None
+        return float(dur), float(dist)
+
+    def duration(self, origin_id, destination_id) -> float:
+        """Leg duration in hours; inf when unroutable (handy as a min() key)."""
+        dur = self.durations[self.index[origin_id], self.index[destination_id]]
+        return float("inf") if np.isnan(dur) else float(dur)
+
+    def sub_distances(self, ids) -> np.ndarray:
+        """Distance block for depot + ids, rows/cols in that order (index 0 = depot)."""
+        rows = np.concatenate(([self.index[DEPOT_ID]], self.rows(ids)))
+        return self.distances[np.ix_(rows, rows)]
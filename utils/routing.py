@@ -1,49 +1,101 @@
-"""Routing utilities: ORS Directions with 2-level cache (memory + file).
+"""Routing utilities: ORS Directions with 2-level cache (memory + SQLite).
 No external Redis dependency required.
 """
-import json
 import os
-import pathlib
-import time
-from functools import lru_cache
+import threading
 import logging
 
 import requests
 from dotenv import load_dotenv
 
+from utils.ors_client import AsyncORSClient, run_sync
+from utils.geo import estimate_leg
+from utils.resilience import ORSRouteError, ORSUnavailableError, call_with_retry, resilience_stats, route_error
+from utils.route_cache import RouteCache
+
 # Load ENV
 load_dotenv()
-ORS_API_KEY = "5b3ce3597851110001cf62480e7559e09dc140e9bfd9a773f454500a"
+ORS_API_KEY = os.getenv("ORS_API_KEY")
+
+# Keep-alive session for sync calls, async pooled client for batches
+_SESSION = requests.Session()
+_ASYNC_CLIENT = AsyncORSClient(ORS_API_KEY)
 
 # Logger setup
 logger = logging.getLogger("routing")
 logging.basicConfig(level=logging.INFO)
 
-# File-based cache
-CACHE_FILE = pathlib.Path(__file__).with_name("ors_cache.json")
-_FILE_CACHE: dict[str, dict] = {}
+# Pair cache: per-process L1 in front of SQLite WAL shared by all workers.
+# Dibuka saat pertama dipakai, bukan saat import (file SQLite + import JSON lama)
+_CACHE: RouteCache | None = None
+_CACHE_LOCK = threading.Lock()
+_UPSTREAM_CALLS = {"directions": 0, "matrix": 0, "coalesced": 0, "fallback_estimates": 0}
+
+
+def _get_cache() -> RouteCache:
+    global _CACHE
+    if _CACHE is None:
+        with _CACHE_LOCK:
+            if _CACHE is None:
+                _CACHE = RouteCache()
+    return _CACHE
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
+
 
-def _load_file_cache():
-    global _FILE_CACHE
-    if CACHE_FILE.exists():
+class _SingleFlight:
+    """In-flight registry: concurrent lookups for the same key share one upstream call."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, _Call] = {}
+
+    def claim(self, key: tuple) -> tuple[_Call, bool]:
+        """Return (call, is_leader). Only the leader performs the work."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                _UPSTREAM_CALLS["coalesced"] += 1
+                return call, False
+            call = self._calls[key] = _Call()
+            return call, True
+
+    def finish(self, key: tuple, call: _Call, result=None, error: BaseException | None = None):
+        call.result, call.error = result, error
+        with self._lock:
+            self._calls.pop(key, None)
+        call.event.set()
+
+    def do(self, key: tuple, fn):
+        call, leader = self.claim(key)
+        if not leader:
+            return call.wait()
         try:
-            _FILE_CACHE = json.loads(CACHE_FILE.read_text())
-        except Exception as e:
-            logger.warning(f"Failed to load cache: {e}")
-            _FILE_CACHE = {}
+            result = fn()
+        except BaseException as exc:
+            self.finish(key, call, error=exc)
+            raise
+        self.finish(key, call, result)
+        return result
 
-def _save_file_cache():
-    try:
-        CACHE_FILE.write_text(json.dumps(_FILE_CACHE))
-    except IOError as e:
-        logger.warning(f"Failed to save cache: {e}")
 
-_load_file_cache()
+_INFLIGHT = _SingleFlight()
 
 # Helpers
 def _check_api_key():
     if not ORS_API_KEY:
-        raise EnvironmentError("ORS_API_KEY not set in environment variables")
+        raise EnvironmentError("ORS_API_KEY not set in environment variables (atau pakai ROUTING_PROVIDER=haversine)")
 
 def _build_headers():
     return {"Authorization": ORS_API_KEY, "Content-Type": "application/json"}
@@ -52,8 +104,23 @@ def _make_key(origin: tuple[float, float], dest: tuple[float, float]) -> str:
     """Create cache key in consistent (lon, lat) order"""
     return f"{origin[0]:.6f},{origin[1]:.6f}:{dest[0]:.6f},{dest[1]:.6f}"
 
+def get_cached_pair(origin: tuple[float, float], dest: tuple[float, float]):
+    """Return cached (duration_h, distance_km) or None without calling ORS."""
+    return _get_cache().get(_make_key(origin, dest))
+
+def get_cached_pairs(pairs: list[tuple[tuple[float, float], tuple[float, float]]]) -> list:
+    """Batched get_cached_pair: one (duration_h, distance_km) or None per pair."""
+    keys = [_make_key(o, d) for o, d in pairs]
+    found = _get_cache().get_many(keys)
+    return [found.get(k) for k in keys]
+
 # Core request (private, no cache)
 def _raw_ors_directions(origin: tuple[float, float], destination: tuple[float, float], profile="driving-car"):
+    """Return (duration_h, distance_km).
+
+    Raises ORSRouteError if ORS cannot route this pair and ORSUnavailableError
+    when ORS is down, over quota or the breaker is open.
+    """
     _check_api_key()
     body = {
         "coordinates": [
@@ -62,73 +129,254 @@ def _raw_ors_directions(origin: tuple[float, float], destination: tuple[float, f
         ],
         "units": "km",
     }
-    r = None
+    _UPSTREAM_CALLS["directions"] += 1
+    r = call_with_retry(lambda: _SESSION.post(
+        f"https://api.openrouteservice.org/v2/directions/{profile}",
+        headers=_build_headers(),
+        json=body,
+        timeout=10,
+    ))
     try:
-        r = requests.post(
-            f"https://api.openrouteservice.org/v2/directions/{profile}",
-            headers=_build_headers(),
-            json=body,
-            timeout=10,
-        )
         r.raise_for_status()
         summary = r.json()["routes"][0]["summary"]
         return round(summary["duration"] / 3600, 2), round(summary["distance"], 2)  # (hours, km)
     except Exception as exc:
-        logger.error(f"ORS Directions error: {exc}")
-        if r is not None and r.text:
-            try:
-                pathlib.Path("ors_directions_error.json").write_text(r.text)
-            except Exception as file_exc:
-                logger.warning(f"Failed to write error file: {file_exc}")
-        return None, None
+        logger.error(f"ORS Directions error: {exc} {r.text[:300]}")
+        raise route_error(r) from exc
+
+def _fallback_leg(origin, destination):
+    """Offline estimate used while ORS is unavailable; never written to the cache."""
+    _UPSTREAM_CALLS["fallback_estimates"] += 1
+    return estimate_leg(origin, destination)
 
 # Public API (with cache)
-@lru_cache(maxsize=20_000)
 def ors_directions_request(origin: tuple[float, float], destination: tuple[float, float], profile: str = "driving-car"):
-    """Return (duration_h, distance_km) using 2-level cache (RAM + file)."""
+    """Return (duration_h, distance_km) using 2-level cache (RAM + SQLite).
+
+    Unroutable pairs return (None, None) and are negatively cached for a short TTL.
+    """
     k = _make_key(origin, destination)
-    if (cached := _FILE_CACHE.get(k)) is not None:
-        return cached["d"], cached["s"]
+    if (cached := _get_cache().get(k)) is not None:
+        return cached
 
-    dur, dist = _raw_ors_directions(origin, destination, profile)
-    if dur is not None:
-        _FILE_CACHE[k] = {"d": dur, "s": dist, "ts": time.time()}
-        _save_file_cache()
-    return dur, dist
+    def _fetch():
+        try:
+            dur, dist = _raw_ors_directions(origin, destination, profile)
+        except ORSUnavailableError as exc:
+            logger.warning(f"ORS unavailable ({exc}), using offline estimate")
+            return _fallback_leg(origin, destination)
+        except ORSRouteError as exc:
+            _get_cache().put_failures([(k, exc.reason, exc.detail)])
+            return None, None
+        _get_cache().put(k, dur, dist)
+        return dur, dist
 
-# Optional preload matrix
-def precompute_matrix(points: list[tuple[float, float]], profile="driving-car"):
-    if len(points) > 50:
-        raise ValueError("ORS Matrix API limited to 50 points max")
+    return _INFLIGHT.do(("directions", profile, k), _fetch)
+
+def directions_many(pairs: list[tuple[tuple[float, float], tuple[float, float]]], profile: str = "driving-car"):
+    """Return (duration_h, distance_km) per pair; cache misses are fetched concurrently."""
+    results = get_cached_pairs(pairs)
+    missing = [idx for idx, cached in enumerate(results) if cached is None]
+
+    if not missing:
+        return results
+
+    # Pair yang sudah di-fetch thread lain cukup ditunggu, sisanya kita fetch sendiri
+    leading, following = [], []
+    for idx in missing:
+        key = ("directions", profile, _make_key(*pairs[idx]))
+        call, leader = _INFLIGHT.claim(key)
+        (leading if leader else following).append((idx, key, call))
+
+    if leading:
+        try:
+            _check_api_key()
+            _UPSTREAM_CALLS["directions"] += len(leading)
+            fetched = run_sync(_ASYNC_CLIENT.directions_many([pairs[idx] for idx, _, _ in leading], profile))
+        except BaseException as exc:
+            for _, key, call in leading:
+                _INFLIGHT.finish(key, call, error=exc)
+            raise
+        entries, failures = [], []
+        for (idx, key, call), result in zip(leading, fetched):
+            if isinstance(result, ORSUnavailableError):
+                result = _fallback_leg(*pairs[idx])
+            elif isinstance(result, ORSRouteError):
+                failures.append((key[2], result.reason, result.detail))
+                result = (None, None)
+            else:
+                entries.append((key[2], *result))
+            results[idx] = result
+            _INFLIGHT.finish(key, call, result)
+        _get_cache().put_many(entries)
+        _get_cache().put_failures(failures)
+
+    for idx, _, call in following:
+        results[idx] = call.wait()
+    return results
+
+# Matrix API (tiled)
+MATRIX_MAX_LOCATIONS = 50
+MATRIX_TILE_SIZE = MATRIX_MAX_LOCATIONS // 2
+
+
+def _raw_ors_matrix(
+    locations: list[tuple[float, float]],
+    sources: list[int],
+    destinations: list[int],
+    profile="driving-car",
+):
+    """One ORS Matrix call. Returns (durations_s, distances_km) rows per source, or (None, None).
 
+    A rejected tile returns (None, None); its pairs are retried one by one by
+    DayMatrix.fill_missing so the bad location can be isolated and negatively cached.
+
+    Raises ORSUnavailableError when ORS is down, over quota, rejects the key or
+    request size, or the breaker is open.
+    """
     _check_api_key()
-    body = {"locations": points, "metrics": ["distance", "duration"], "units": "km"}
+    body = {
+        "locations": [[float(lon), float(lat)] for lon, lat in locations],
+        "sources": sources,
+        "destinations": destinations,
+        "metrics": ["distance", "duration"],
+        "units": "km",
+    }
+    _UPSTREAM_CALLS["matrix"] += 1
+    r = call_with_retry(lambda: _SESSION.post(
+        f"https://api.openrouteservice.org/v2/matrix/{profile}",
+        headers=_build_headers(),
+        json=body,
+        timeout=30,
+    ))
     try:
-        r = requests.post(
-            f"https://api.openrouteservice.org/v2/matrix/{profile}",
-            headers=_build_headers(),
-            json=body,
-            timeout=30,
-        )
         r.raise_for_status()
         data = r.json()
-        durs = data["durations"]
-        dists = data["distances"]
-        n = len(points)
-        for i in range(n):
-            for j in range(n):
-                if i == j:
-                    continue
-                dur_h = round(durs[i][j] / 3600, 2)
-                dist_km = round(dists[i][j], 2)
-                _FILE_CACHE[_make_key(points[i], points[j])] = {
-                    "d": dur_h,
-                    "s": dist_km,
-                    "ts": time.time(),
-                }
-        _save_file_cache()
+        return data["durations"], data["distances"]
     except Exception as exc:
-        logger.error(f"ORS Matrix preload error: {exc}")
+        logger.error(f"ORS Matrix error: {exc}")
+        error = route_error(r)
+        if isinstance(error, ORSUnavailableError):
+            raise error from exc  # mis. key salah / 413: jangan diulang per pair
+        return None, None
+
+
+def ors_matrix_request(points: list[tuple[float, float]], profile="driving-car",
+                       blocks: set[tuple[int, int]] | None = None):
+    """Return full (durations_h, distances_km) n x n matrices for points (lon, lat).
+
+    Point sets larger than the 50-location Matrix limit are split into tiles of
+    MATRIX_TILE_SIZE, so every request carries at most two tiles. Cells ORS could
+    not route are None. Every routed pair is written to the pair cache once.
+    blocks (see missing_blocks) limits the fetch to those tile pairs; cells
+    outside them stay None. Concurrent requests for the same work share one build.
+    """
+    key = ("matrix", profile, tuple(f"{float(lon):.6f},{float(lat):.6f}" for lon, lat in points),
+           None if blocks is None else frozenset(blocks))
+    return _INFLIGHT.do(key, lambda: _build_ors_matrix(points, profile, blocks))
+
+
+def _tiles(n: int) -> list[list[int]]:
+    return [list(range(start, min(start + MATRIX_TILE_SIZE, n))) for start in range(0, n, MATRIX_TILE_SIZE)]
+
+
+def missing_blocks(cells) -> set[tuple[int, int]]:
+    """(source tile, destination tile) pairs that contain the given (i, j) cells."""
+    return {(i // MATRIX_TILE_SIZE, j // MATRIX_TILE_SIZE) for i, j in cells}
+
+
+def _build_ors_matrix(points: list[tuple[float, float]], profile="driving-car", blocks: set[tuple[int, int]] | None = None):
+    """Fetch the tiled matrix; blocks limits the fetch to those (source tile, destination tile) pairs."""
+    n = len(points)
+    durations = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+    distances = [[0.0 if i == j else None for j in range(n)] for i in range(n)]
+    if n < 2:
+        return durations, distances
+
+    tiles = _tiles(n)
+    entries, failures = [], []
+    for t_src, src_tile in enumerate(tiles):
+        for t_dst, dst_tile in enumerate(tiles):
+            if blocks is not None and (t_src, t_dst) not in blocks:
+                continue
+            if src_tile is dst_tile:
+                idx = src_tile
+                sources = destinations = list(range(len(idx)))
+            else:
+                idx = src_tile + dst_tile
+                sources = list(range(len(src_tile)))
+                destinations = list(range(len(src_tile), len(idx)))
+
+            try:
+                durs, dists = _raw_ors_matrix([points[k] for k in idx], sources, destinations, profile)
+            except ORSUnavailableError as exc:
+                logger.warning(f"ORS unavailable ({exc}), estimating {len(sources) * len(destinations)} legs offline")
+                for s in sources:
+                    for d in destinations:
+                        i, j = idx[s], idx[d]
+                        if i != j:
+                            durations[i][j], distances[i][j] = _fallback_leg(points[i], points[j])
+                continue
+            if durs is None:
+                continue
+
+            for si, s in enumerate(sources):
+                for di, d in enumerate(destinations):
+                    i, j = idx[s], idx[d]
+                    if i == j:
+                        continue
+                    if durs[si][di] is None or dists[si][di] is None:
+                        failures.append((_make_key(points[i], points[j]), "unroutable", "null cell in ORS matrix"))
+                        continue
+                    dur_h = round(durs[si][di] / 3600, 2)
+                    dist_km = round(dists[si][di], 2)
+                    durations[i][j] = dur_h
+                    distances[i][j] = dist_km
+                    entries.append((_make_key(points[i], points[j]), dur_h, dist_km))
+    _get_cache().put_many(entries)
+    _get_cache().put_failures(failures)
+    return durations, distances
+
+
+def precompute_matrix(points: list[tuple[float, float]], profile="driving-car"):
+    """Warm the pair cache for every ordered pair of points."""
+    ors_matrix_request(points, profile)
+
+
+def warm_missing_legs(points: list[tuple[float, float]], profile="driving-car") -> dict:
+    """Fetch only the matrix tiles that still contain uncached legs of points x points.
+
+    Put new/changed points first: their rows and columns then fall into their own
+    tiles and the Matrix requests carry almost nothing already cached.
+    """
+    n = len(points)
+    cells = [(i, j) for i in range(n) for j in range(n) if i != j]
+    cached = get_cached_pairs([(points[i], points[j]) for i, j in cells])
+    missing = [cell for cell, hit in zip(cells, cached) if hit is None]
+
+    blocks = missing_blocks(missing)
+    if blocks:
+        _build_ors_matrix(points, profile, blocks)
+    return {"points": n, "missing_legs": len(missing), "matrix_requests": len(blocks)}
+
+
+def list_failed_pairs(limit: int = 500) -> list[dict]:
+    return _get_cache().list_failures(limit)
+
+def purge_failed_pairs(origin: tuple[float, float] | None = None, destination: tuple[float, float] | None = None) -> int:
+    """Forget cached failures (all, or one pair) so the next lookup asks ORS again."""
+    if origin is not None and destination is not None:
+        return _get_cache().purge_failures(_make_key(origin, destination))
+    return _get_cache().purge_failures()
+
+def routing_stats() -> dict:
+    """Cache tier counters and upstream ORS call counts for this worker."""
+    return {
+        "pid": os.getpid(),
+        "cache": _get_cache().stats(),
+        "upstream_calls": dict(_UPSTREAM_CALLS),
+        **resilience_stats(),
+    }
 
 # Legacy
 def ors_matrix_request_with_adjustment(*_args, **_kwargs):
@@ -0,0 +1,84 @@
+"""Grid spatial index over stop coordinates for k-nearest candidate pruning.
+
+Nearest-neighbor routing only needs road durations for the few stops that are
+close by; the index returns the k great-circle nearest active stops so the
+road lookup runs O(n*k) times per route instead of O(n^2).
+"""
+import math
+import os
+
+import numpy as np
+
+from utils.geo import haversine_matrix
+
+NN_CANDIDATES = int(os.getenv("NN_CANDIDATES", "8"))
+GRID_CELL_KM = float(os.getenv("GRID_CELL_KM", "2"))
+MAX_RING = 32  # lebih jauh dari ini langsung scan semua titik aktif
+
+_KM_PER_DEG_LAT = 110.574
+_KM_PER_DEG_LON = 111.320
+
+
+class SpatialIndex:
+    """Uniform grid (equirectangular cells of GRID_CELL_KM) over (lon, lat) points.
+
+    Points can be removed as they are visited; nearest() only returns active ones.
+    """
+
+    def __init__(self, points, cell_km: float = GRID_CELL_KM):
+        self.coords = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.cell_km = cell_km
+        lat0 = float(self.coords[:, 1].mean()) if len(self.coords) else 0.0
+        self._kx = _KM_PER_DEG_LON * math.cos(math.radians(lat0)) / cell_km
+        self._ky = _KM_PER_DEG_LAT / cell_km
+        self.active = np.ones(len(self.coords), dtype=bool)
+        self.remaining = len(self.coords)
+        self.cells: dict[tuple[int, int], set[int]] = {}
+        for i, (lon, lat) in enumerate(self.coords):
+            self.cells.setdefault(self._cell(lon, lat), set()).add(i)
+
+    def _cell(self, lon: float, lat: float) -> tuple[int, int]:
+        return math.floor(lon * self._kx), math.floor(lat * self._ky)
+
+    def remove(self, i: int):
+        if self.active[i]:
+            self.active[i] = False
+            self.remaining -= 1
+            self.cells[self._cell(*self.coords[i])].discard(i)
+
+    def _ring(self, cx: int, cy: int, r: int):
+        if r == 0:
+            yield cx, cy
+            return
+        for dx in range(-r, r + 1):
+            yield cx + dx, cy - r
+            yield cx + dx, cy + r
+        for dy in range(-r + 1, r):
+            yield cx - r, cy + dy
+            yield cx + r, cy + dy
+
+    def nearest(self, coord, k: int = NN_CANDIDATES) -> list[int]:
+        """Indices of the k active points nearest to coord, closest first."""
+        k = min(k, self.remaining)
+        if k <= 0:
+            return []
+        cx, cy = self._cell(float(coord[0]), float(coord[1]))
+        found: list[int] = []
+        r = 0
+        while True:
+            for cell in self._ring(cx, cy, r):
+                found.extend(self.cells.get(cell, ()))
+            # Semua sel di luar ring r berjarak >= r * cell_km dari coord
+            if len(found) >= self.remaining:
+                break
+            if len(found) >= k:
+                dist = haversine_matrix([coord], self.coords[found])[0]
+                if np.partition(dist, k - 1)[k - 1] <= r * self.cell_km * 0.99:
+                    break
+            r += 1
+            if r > MAX_RING:
+                found = np.flatnonzero(self.active).tolist()
+                break
+        dist = haversine_matrix([coord], self.coords[found])[0]
+        order = np.argsort(dist, kind="stable")[:k]
+        return [found[i] for i in order]